@@ -0,0 +1,386 @@
+import hmac
+import logging
+import os
+import time
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+try:
+    from .knowledge_base import documents as docs
+    from .config import Settings, load_settings
+    from .components import Components
+    from .executors import executor_stats, run_in
+    from .local_embeddings import LocalEmbeddings
+    from .retrieval_client import RemoteRetrievalService
+    from .pipeline import BatchChatRequest, ChatPipeline, ChatRequest, JournalRequest
+    from .profiling import Profiling, ProfilingUpdate, task_stacks, top_allocators
+    from .lifecycle import DrainRequest, Lifecycle, SwapRequest
+    from .index_versions import ReindexRequest, Reindexer
+except ImportError:
+    from knowledge_base import documents as docs
+    from config import Settings, load_settings
+    from components import Components
+    from executors import executor_stats, run_in
+    from local_embeddings import LocalEmbeddings
+    from retrieval_client import RemoteRetrievalService
+    from pipeline import BatchChatRequest, ChatPipeline, ChatRequest, JournalRequest
+    from profiling import Profiling, ProfilingUpdate, task_stacks, top_allocators
+    from lifecycle import DrainRequest, Lifecycle, SwapRequest
+    from index_versions import ReindexRequest, Reindexer
+
+logger = logging.getLogger(__name__)
+
+# Work that holds components while it runs: tracked for drain and hot-swap retirement
+ADMITTED_PATHS = ("/chat", "/chat/batch", "/journal")
+
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "http://localhost:5173",
+    "http://localhost:8080",
+    "http://127.0.0.1:3000",
+    "http://127.0.0.1:5173",
+    "http://127.0.0.1:8080",
+    "https://localhost:3000",
+    "https://localhost:5173",
+    "https://synapse-mindscribe.netlify.app/",
+    "*"
+]
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    settings = settings or load_settings()
+    components = Components(settings)
+    pipeline = ChatPipeline(components)
+    profiling = Profiling(settings.profile_sample_rate, settings.profile_max_results, settings.loop_stall_threshold_ms)
+
+    app = FastAPI()
+    app.state.settings = settings
+    app.state.components = components
+    app.state.pipeline = pipeline
+    app.state.profiling = profiling
+    lifecycle = Lifecycle(components, drain_timeout=settings.drain_timeout)
+    app.state.lifecycle = lifecycle
+    reindexer = Reindexer(components, lifecycle)
+    app.state.reindexer = reindexer
+
+    def require_admin(x_admin_token: Optional[str] = Header(None)):
+        # No configured secret means no admin surface at all
+        expected = os.getenv(settings.admin_token_env) if settings.admin_token_env else None
+        if not expected:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+            raise HTTPException(status_code=403, detail="Forbidden")
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.middleware("http")
+    async def admit_requests(request: Request, call_next):
+        if request.method != "POST" or request.url.path not in ADMITTED_PATHS:
+            return await call_next(request)
+        if not lifecycle.admitting:
+            lifecycle.reject()
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Server is draining"},
+                headers={"Retry-After": "5", "Connection": "close"}
+            )
+        version = lifecycle.enter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            lifecycle.exit(version)
+            raise
+        # Counted as in flight until the streamed body has been sent
+        response.body_iterator = lifecycle.track(response.body_iterator, version)
+        return response
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        start_time = time.time()
+        logger.info(f"Request: {request.method} {request.url}")
+        if profiling.requests.should_profile():
+            # Profiling stops when the (possibly streamed) body is fully sent
+            label = f"{request.method} {request.url.path}"
+            started_at = time.monotonic()
+            profile = profiling.requests.start()
+            try:
+                response = await call_next(request)
+            except Exception:
+                profiling.requests.finish(profile, label, started_at)
+                raise
+            response.body_iterator = profiling.requests.wrap_body(response.body_iterator, profile, label, started_at)
+        else:
+            response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info(f"Request completed in {process_time:.2f}s with status {response.status_code}")
+        return response
+
+    @app.on_event("startup")
+    async def startup_event():
+        try:
+            await components.initialize(docs)
+        except Exception as e:
+            logger.error(f"FATAL: Error during application startup: {e}")
+            components.initialization_complete = False
+            components.initialization_error = str(e)
+        if components.ready and components.pending_reindex:
+            # Serving an older index version: build the configured one in the background
+            reindexer.start(ReindexRequest(settings=components.pending_reindex))
+        profiling.watchdog.start()
+        lifecycle.install_signal_handlers()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        # Already done if shutdown came through SIGTERM
+        await lifecycle.drain()
+        await reindexer.close()
+        await lifecycle.close()
+        profiling.watchdog.stop()
+        await components.close()
+
+    @app.post("/chat")
+    async def chat_endpoint(request: ChatRequest, http_request: Request):
+        # Clients opt into the structured SSE protocol via the Accept header
+        if "text/event-stream" in http_request.headers.get("accept", ""):
+            return StreamingResponse(
+                pipeline.events(request),
+                media_type="text/event-stream",
+                headers={
+                    "Cache-Control": "no-cache",
+                    "Connection": "keep-alive",
+                    "X-Accel-Buffering": "no",
+                    "Access-Control-Allow-Origin": "*",
+                }
+            )
+        try:
+            return StreamingResponse(
+                pipeline.stream(request),
+                media_type="text/plain",
+                headers={
+                    "Cache-Control": "no-cache",
+                    "Connection": "keep-alive",
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Methods": "POST",
+                    "Access-Control-Allow-Headers": "*",
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error in chat endpoint: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+    @app.post("/chat/batch")
+    async def chat_batch_endpoint(request: BatchChatRequest):
+        if not components.ready:
+            raise HTTPException(status_code=503, detail="System is not ready")
+        if not request.items:
+            raise HTTPException(status_code=400, detail="No items provided")
+        if len(request.items) > settings.max_batch_items:
+            raise HTTPException(status_code=413, detail=f"Batch size exceeds limit of {settings.max_batch_items} items")
+
+        logger.info(f"Processing batch of {len(request.items)} items")
+        return StreamingResponse(
+            pipeline.batch(request),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache"}
+        )
+
+    @app.post("/journal")
+    async def journal_endpoint(request: JournalRequest):
+        # Journal entries only feed the user's long-term memory, they are not chat turns
+        if not components.user_memory:
+            raise HTTPException(status_code=404, detail="User memory is not enabled")
+        if not components.ready:
+            raise HTTPException(status_code=503, detail="System is not ready")
+        if not request.user_id or not request.text.strip():
+            raise HTTPException(status_code=400, detail="user_id and text are required")
+        await pipeline.remember_journal(request)
+        return {"stored": True}
+
+
+    @app.get("/health")
+    async def health_check():
+        retrieval_service = components.retrieval_service
+        server_status = await retrieval_service.server_status() if isinstance(retrieval_service, RemoteRetrievalService) else None
+        status = "healthy" if components.initialization_complete else "initializing"
+        if components.initialization_error:
+            status = "error"
+        elif not lifecycle.admitting:
+            status = lifecycle.state
+        elif components.brownout and components.brownout.level > 0:
+            status = "degraded"
+        elif components.initialization_complete and (components.embeddings_breaker.state != "closed" or components.llm_breaker.state != "closed"):
+            status = "degraded"
+        elif server_status and not server_status["reachable"]:
+            status = "degraded"
+
+        embeddings = components.embeddings
+        settings = components.settings  # reflects hot-swaps
+        return {
+            "status": status,
+            "initialization_complete": components.initialization_complete,
+            "components_ready": components.ready,
+            "error": components.initialization_error,
+            "components": {
+                "llm": components.llm is not None,
+                "embeddings": embeddings is not None,
+                "retriever": retrieval_service is not None,
+                "prompt_template": components.prompt_template is not None,
+                "documents_loaded": len(docs) if docs else 0
+            },
+            "circuit_breakers": {
+                "embeddings": components.embeddings_breaker.snapshot(),
+                "llm": components.llm_breaker.snapshot()
+            },
+            "preset": settings.preset,
+            "ai_provider": f"{settings.llm_provider} ({settings.llm_model})",
+            "embeddings_provider": f"local ({embeddings.model_name}, {embeddings.backend})" if isinstance(embeddings, LocalEmbeddings) else f"{settings.embeddings_provider} ({settings.embeddings_model})",
+            "local_embeddings": embeddings.stats() if isinstance(embeddings, LocalEmbeddings) else None,
+            "prompt": {"name": components.prompt_template.name, "layout": settings.prompt_layout, "stable_prefix_chars": len(components.prompt_template.stable_prefix)} if components.prompt_template else None,
+            "llm_usage": components.llm_usage.snapshot(),
+            "retrieval": retrieval_service.stats() if retrieval_service else None,
+            "retrieval_server": server_status,
+            "query_condenser": components.condenser.stats() if components.condenser else None,
+            "retrieval_prefetch": components.prefetcher.stats() if components.prefetcher else None,
+            "query_embedding_batcher": retrieval_service.query_batcher.stats() if retrieval_service and retrieval_service.query_batcher else None,
+            "mode": settings.description,
+            "timestamp": time.time(),
+            "active_conversations": len(components.history),
+            "conversation_log": components.history.stats(),
+            "user_memory": components.user_memory.stats() if components.user_memory else None,
+            "traffic_capture": components.traffic.stats() if components.traffic else None,
+            "lifecycle": lifecycle.stats(),
+            "index_versions": components.index_store.stats() if components.index_store else None,
+            "reindex": reindexer.stats(),
+            "brownout": components.brownout.stats() if components.brownout else None,
+            "executors": executor_stats()
+        }
+
+    @app.post("/admin/drain", dependencies=[Depends(require_admin)])
+    async def admin_drain(request: DrainRequest):
+        if request.wait:
+            await lifecycle.drain(request.timeout)
+        else:
+            lifecycle.start_drain(request.timeout)
+        return lifecycle.stats()
+
+    @app.post("/admin/resume", dependencies=[Depends(require_admin)])
+    async def admin_resume():
+        lifecycle.resume()
+        return lifecycle.stats()
+
+    @app.post("/admin/swap", dependencies=[Depends(require_admin)])
+    async def admin_swap(request: SwapRequest):
+        if not components.ready:
+            raise HTTPException(status_code=503, detail="System is not ready")
+        try:
+            return await lifecycle.swap(request.component, request.settings)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            # The live components are untouched when staging fails
+            logger.error(f"Swap of {request.component} failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Swap failed: {e}")
+
+    @app.get("/admin/reindex", dependencies=[Depends(require_admin)])
+    async def reindex_status():
+        return {
+            **reindexer.stats(),
+            "index_versions": components.index_store.stats() if components.index_store else None,
+        }
+
+    @app.post("/admin/reindex", dependencies=[Depends(require_admin)])
+    async def reindex_start(request: ReindexRequest):
+        # Builds new embeddings + index in the background while the current one serves
+        if not components.ready:
+            raise HTTPException(status_code=503, detail="System is not ready")
+        try:
+            return reindexer.start(request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.post("/admin/reindex/cutover", dependencies=[Depends(require_admin)])
+    async def reindex_cutover():
+        try:
+            return await reindexer.cut_over()
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @app.post("/admin/reindex/abort", dependencies=[Depends(require_admin)])
+    async def reindex_abort():
+        try:
+            return await reindexer.abort()
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+    async def profiling_status():
+        return profiling.stats()
+
+    @app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+    async def profiling_update(update: ProfilingUpdate):
+        profiling.update(update)
+        logger.info(f"Profiling updated: {update.model_dump(exclude_none=True)}")
+        return profiling.stats()
+
+    @app.get("/admin/profiling/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+    async def profiling_result(profile_id: int, format: str = "text", sort: str = "cumulative", limit: int = 40):
+        # format=prof downloads raw pstats data (pstats.Stats, snakeviz); text is a summary
+        result = profiling.requests.get(profile_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        if format == "prof":
+            return Response(
+                result["data"],
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="mindscribe-{profile_id}.prof"'}
+            )
+        return PlainTextResponse(profiling.requests.report(profile_id, sort, limit))
+
+    @app.get("/admin/tasks", dependencies=[Depends(require_admin)])
+    async def admin_tasks():
+        return {"tasks": task_stacks(), "executors": executor_stats(), "loop_watchdog": profiling.watchdog.stats()}
+
+    @app.get("/admin/memory", dependencies=[Depends(require_admin)])
+    async def admin_memory(limit: int = 25, group_by: str = "lineno"):
+        if not profiling.stats()["tracemalloc"]:
+            raise HTTPException(status_code=409, detail="tracemalloc is not running, enable it via POST /admin/profiling")
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+        return await run_in("maintenance", top_allocators, limit, group_by)
+
+    @app.get("/status")
+    async def status_check():
+        return {
+            "embeddings_ready": components.embeddings is not None,
+            "llm_ready": components.llm is not None,
+            "vector_ready": components.vector is not None,
+            "retriever_ready": components.retrieval_service is not None,
+            "prompt_ready": components.prompt_template is not None,
+            "initialization_complete": components.initialization_complete,
+            "total_documents": len(docs) if docs else 0
+        }
+
+    @app.get("/ping")
+    def ping():
+        return "OK"
+
+    @app.get("/")
+    async def root():
+        return {"message": "MindScribe Therapeutic AI with RAG is running", "version": settings.version, "preset": settings.preset}
+
+    @app.exception_handler(Exception)
+    async def global_exception_handler(request: Request, exc: Exception):
+        logger.error(f"Global exception handler caught: {exc}")
+        return JSONResponse(status_code=500, content={"detail": "Internal server error"})
+
+    return app
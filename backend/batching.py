@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class QueryEmbeddingBatcher:
+    # Collects single-query embed requests from concurrent /chat calls for up to
+    # max_wait_ms (or max_batch_size items) and sends them as one batched call,
+    # then fans the vectors back out to the waiting requests.
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[Sequence[Sequence[float]]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 3.0,
+        max_concurrent_batches: int = 4,
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._batch_tasks = set()
+
+        self.total_batches = 0
+        self.total_items = 0
+        self.total_wait = 0.0
+        self.batch_size_histogram = {f"<={bucket}": 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.batch_size_histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] = 0
+
+    def _ensure_started(self):
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._in_flight = asyncio.Semaphore(self.max_concurrent_batches)
+            self._collector = asyncio.create_task(self._collect())
+
+    async def embed(self, text: str) -> List[float]:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.monotonic()))
+        return await future
+
+    async def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*[self.embed(text) for text in texts]))
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Keep collecting the next batch while this one is in flight
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            # Requests that were cancelled while queued don't need embedding
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                return
+            self._record(batch)
+            try:
+                vectors = await self.embed_batch([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(list(vector))
+        finally:
+            self._in_flight.release()
+
+    def _record(self, batch):
+        now = time.monotonic()
+        self.total_batches += 1
+        self.total_items += len(batch)
+        self.total_wait += sum(now - enqueued_at for _, _, enqueued_at in batch)
+        for bucket in BATCH_SIZE_BUCKETS:
+            if len(batch) <= bucket:
+                self.batch_size_histogram[f"<={bucket}"] += 1
+                break
+        else:
+            self.batch_size_histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "avg_batch_size": round(self.total_items / self.total_batches, 2) if self.total_batches else None,
+            "avg_queue_wait_ms": round(1000 * self.total_wait / self.total_items, 2) if self.total_items else None,
+            "batch_size_histogram": self.batch_size_histogram,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches_in_flight": len(self._batch_tasks),
+        }
+
+    async def close(self):
+        if self._collector:
+            self._collector.cancel()
+        for task in list(self._batch_tasks):
+            task.cancel()
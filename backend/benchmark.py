@@ -0,0 +1,138 @@
+import argparse
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+try:
+    from .retrieval import FaissStoreIndex
+    from .vector_index import EmbeddingMatrixIndex, normalize_rows
+except ImportError:
+    from retrieval import FaissStoreIndex
+    from vector_index import EmbeddingMatrixIndex, normalize_rows
+
+# Offline retrieval benchmark on synthetic embeddings (no API keys needed).
+# Usage: python benchmark.py --docs 5000 --queries 200 --dim 1024 --k 5
+
+
+def make_corpus(n_docs: int, n_queries: int, dim: int, seed: int = 0):
+    # Clustered vectors so neighbours are meaningful, queries are perturbed documents
+    rng = np.random.default_rng(seed)
+    n_topics = max(1, n_docs // 20)
+    centers = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    doc_vectors = centers[rng.integers(0, n_topics, n_docs)] + 0.5 * rng.standard_normal((n_docs, dim)).astype(np.float32)
+    doc_vectors = normalize_rows(doc_vectors)
+    picks = rng.integers(0, n_docs, n_queries)
+    query_vectors = normalize_rows(doc_vectors[picks] + 0.3 * rng.standard_normal((n_queries, dim)).astype(np.float32))
+    texts = [f"synthetic document {i}" for i in range(n_docs)]
+    return doc_vectors, query_vectors, texts
+
+
+def row_ids(results) -> List[List[int]]:
+    return [[doc.metadata["row"] for doc, _ in row] for row in results]
+
+
+def recall_at_k(found: List[List[int]], truth: List[List[int]]) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    total = sum(len(t) for t in truth)
+    return hits / total if total else 1.0
+
+
+def time_it(fn: Callable[[], object], repeats: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(args) -> List[Dict]:
+    doc_vectors, query_vectors, texts = make_corpus(args.docs, args.queries, args.dim, args.seed)
+    metadatas = [{"row": i} for i in range(len(texts))]
+
+    vector_store = FAISS.from_embeddings(
+        list(zip(texts, doc_vectors.tolist())),
+        DeterministicFakeEmbedding(size=args.dim),
+        metadatas=metadatas,
+    )
+    engines = {
+        "langchain_faiss_per_query": lambda q: [vector_store.similarity_search_with_score_by_vector(v.tolist(), k=args.k) for v in q],
+        "faiss_matrix": lambda q: FaissStoreIndex(vector_store).search_with_scores(q, args.k),
+    }
+    memory = {
+        "langchain_faiss_per_query": doc_vectors.nbytes,
+        "faiss_matrix": doc_vectors.nbytes,
+    }
+    for dtype in ("float32", "float16"):
+        index = EmbeddingMatrixIndex(doc_vectors, texts, metadatas, dtype=dtype)
+        engines[f"numpy_{dtype}"] = lambda q, index=index: index.search_with_scores(q, args.k)
+        memory[f"numpy_{dtype}"] = index.nbytes
+
+    # Quantized storage, scored directly and with float re-ranking of a shortlist
+    # read from a persisted, memory-mapped index (as deployed)
+    tmp_dir = tempfile.TemporaryDirectory()
+    for quantization in ("int8", "binary"):
+        index = EmbeddingMatrixIndex(doc_vectors, texts, metadatas, quantization=quantization)
+        engines[f"numpy_{quantization}"] = lambda q, index=index: index.search_with_scores(q, args.k)
+        memory[f"numpy_{quantization}"] = index.nbytes
+
+        path = f"{tmp_dir.name}/{quantization}"
+        EmbeddingMatrixIndex(
+            doc_vectors, texts, metadatas, quantization=quantization,
+            keep_rerank_vectors=True, rerank_factor=args.rerank_factor
+        ).save(path)
+        index = EmbeddingMatrixIndex.load(path)
+        engines[f"numpy_{quantization}_rerank"] = lambda q, index=index: index.search_with_scores(q, args.k)
+        memory[f"numpy_{quantization}_rerank"] = index.nbytes
+
+    # Exact float32 cosine ranking is the ground truth for recall
+    exact = EmbeddingMatrixIndex(doc_vectors, texts, metadatas)
+    _, truth = exact.search(query_vectors, args.k)
+    truth = truth.tolist()
+
+    rows = []
+    for name, engine in engines.items():
+        seconds, results = time_it(lambda: engine(query_vectors), args.repeats)
+        rows.append({
+            "engine": name,
+            "ms_per_query": 1000 * seconds / len(query_vectors),
+            "memory_mb": memory[name] / (1024 * 1024),
+            "memory_ratio": memory[name] / doc_vectors.nbytes,
+            "recall": recall_at_k(row_ids(results), truth),
+        })
+    tmp_dir.cleanup()
+    return rows
+
+
+def print_table(rows: List[Dict]):
+    # memory is resident index memory; vs f32 compares it to the raw float32 vectors
+    print(f"{'engine':<28}{'ms/query':>10}{'memory MB':>12}{'vs f32':>8}{'recall@k':>10}{'loss':>8}")
+    for row in rows:
+        print(
+            f"{row['engine']:<28}{row['ms_per_query']:>10.4f}{row['memory_mb']:>12.2f}"
+            f"{row['memory_ratio']:>8.2f}{row['recall']:>10.3f}{1 - row['recall']:>8.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MindScribe retrieval engines")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.docs} docs x {args.dim}d, {args.queries} queries, k={args.k}")
+    print_table(run(args))
+
+
+if __name__ == "__main__":
+    main()
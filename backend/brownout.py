@@ -0,0 +1,152 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Each level keeps every degradation of the levels before it
+BROWNOUT_LEVELS = ("normal", "reduced_k", "no_history", "capped_tokens", "cheaper_model", "canned")
+MIN_LATENCY_SAMPLES = 5
+
+
+class BrownoutPlan:
+    # What a request may use at the current level
+    def __init__(self, level: int, k: Optional[int] = None, max_tokens: Optional[int] = None):
+        self.level = level
+        self.name = BROWNOUT_LEVELS[level]
+        self.k = k if level >= 1 else None
+        self.use_history = level < 2
+        self.max_tokens = max_tokens if level >= 3 else None
+        self.cheaper_model = level >= 4
+        self.canned = level >= 5
+
+
+NORMAL_PLAN = BrownoutPlan(0)
+
+
+def cap_tokens(llm, provider: str, max_tokens: int):
+    # Ollama takes the limit as a model option, chat models as a call argument
+    if provider == "ollama":
+        return llm.model_copy(update={"num_predict": max_tokens})
+    return llm.bind(max_tokens=max_tokens)
+
+
+class BrownoutController:
+    # Steps through BROWNOUT_LEVELS under pressure so latency stays bounded instead of
+    # every request timing out. Pressure is the larger of in-flight pipeline requests
+    # over max_in_flight and the recent p95 latency over target_p95_ms. At most once
+    # per step_interval the level moves one step: up while pressure >= 1, down once it
+    # falls below recover_ratio. Only full-pipeline requests are measured, so canned
+    # replies neither count as load nor make the latency look healthy.
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        target_p95_ms: float = 8000.0,
+        window: float = 30.0,
+        step_interval: float = 5.0,
+        recover_ratio: float = 0.6,
+        k: int = 2,
+        max_tokens: int = 300,
+        max_level: int = len(BROWNOUT_LEVELS) - 1,
+    ):
+        self.max_in_flight = max_in_flight
+        self.target_p95_ms = target_p95_ms
+        self.window = window
+        self.step_interval = step_interval
+        self.recover_ratio = recover_ratio
+        self.max_level = max_level
+        self.plans = [BrownoutPlan(level, k, max_tokens) for level in range(len(BROWNOUT_LEVELS))]
+
+        self.level = 0
+        self.in_flight = 0
+        self.latencies: Deque[Tuple[float, float]] = deque()
+        self.last_step = 0.0
+        self.level_since = time.monotonic()
+        self.time_at_level = [0.0] * len(BROWNOUT_LEVELS)
+        self.activations = [0] * len(BROWNOUT_LEVELS)
+        self.requests_at_level = [0] * len(BROWNOUT_LEVELS)
+        self._capped: Dict[int, Tuple[object, object]] = {}
+
+    def latency_percentiles(self) -> Optional[Dict[str, float]]:
+        cutoff = time.monotonic() - self.window
+        while self.latencies and self.latencies[0][0] < cutoff:
+            self.latencies.popleft()
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        p50, p95, p99 = np.percentile([latency for _, latency in self.latencies], [50, 95, 99])
+        return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1)}
+
+    def pressure(self) -> float:
+        percentiles = self.latency_percentiles()
+        latency_pressure = percentiles["p95_ms"] / self.target_p95_ms if percentiles else 0.0
+        return max(self.in_flight / self.max_in_flight, latency_pressure)
+
+    def evaluate(self):
+        now = time.monotonic()
+        if now - self.last_step < self.step_interval:
+            return
+        pressure = self.pressure()
+        if pressure >= 1.0 and self.level < self.max_level:
+            self._set_level(self.level + 1, pressure, now)
+        elif pressure < self.recover_ratio and self.level > 0:
+            # After a quiet spell, catch up on the steps down that no request triggered
+            steps = max(1, int((now - self.last_step) / self.step_interval))
+            self._set_level(max(0, self.level - steps), pressure, now)
+
+    def _set_level(self, level: int, pressure: float, now: float):
+        self.time_at_level[self.level] += now - self.level_since
+        self.level_since = now
+        self.last_step = now
+        direction = "up" if level > self.level else "down"
+        self.level = level
+        if direction == "up":
+            self.activations[level] += 1
+        logger.warning(f"Brownout {direction} to level {level} ({BROWNOUT_LEVELS[level]}), pressure {pressure:.2f}")
+
+    def plan(self) -> BrownoutPlan:
+        self.evaluate()
+        self.requests_at_level[self.level] += 1
+        return self.plans[self.level]
+
+    def enter(self) -> float:
+        self.in_flight += 1
+        return time.monotonic()
+
+    def exit(self, started_at: float):
+        self.in_flight -= 1
+        now = time.monotonic()
+        self.latencies.append((now, (now - started_at) * 1000))
+
+    def llm_for(self, plan: BrownoutPlan, llm, cheaper_llm, provider: str):
+        if plan.cheaper_model and cheaper_llm is not None:
+            llm = cheaper_llm
+        if plan.max_tokens is None:
+            return llm
+        # One capped wrapper per model, rebuilt if the model is swapped out
+        cached = self._capped.get(id(llm))
+        if cached is None or cached[0] is not llm:
+            cached = (llm, cap_tokens(llm, provider, plan.max_tokens))
+            self._capped[id(llm)] = cached
+        return cached[1]
+
+    def stats(self) -> dict:
+        time_at_level = list(self.time_at_level)
+        time_at_level[self.level] += time.monotonic() - self.level_since
+        return {
+            "level": self.level,
+            "level_name": BROWNOUT_LEVELS[self.level],
+            "pressure": round(self.pressure(), 3),
+            "in_flight": self.in_flight,
+            "latency": self.latency_percentiles(),
+            "levels": {
+                name: {
+                    "activations": self.activations[level],
+                    "requests": self.requests_at_level[level],
+                    "seconds": round(time_at_level[level], 1),
+                }
+                for level, name in enumerate(BROWNOUT_LEVELS)
+            },
+        }
@@ -0,0 +1,570 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .config import Settings
+    from .conversation_log import ConversationLog
+    from .history import ConversationHistory, NoHistory
+    from .prompts import build_prompt_template
+    from .resilience import CircuitBreaker
+    from .retrieval import FaissStoreIndex, QueryVectorCache, RetrievalService
+    from .vector_index import EmbeddingMatrixIndex, publish_index, store_fingerprint
+    from .partitions import PartitionedIndex
+    from .local_embeddings import LocalEmbeddings
+    from .batching import QueryEmbeddingBatcher
+    from .reranking import DEFAULT_THRESHOLDS, build_reranker
+    from .dedup import NearDuplicateIndex
+    from .prefetch import RetrievalPrefetcher
+    from .executors import run_in, shutdown_executors
+    from .usage import TokenUsageTracker, response_text
+    from .condense import QueryCondenser
+    from .user_memory import UserMemoryStore
+    from .brownout import BrownoutController
+    from .retrieval_client import RemoteRetrievalService
+    from .index_versions import IndexStore, corpus_fingerprint, describe, embeddings_identity, embeddings_tag, identity_overrides
+    from .traffic import TrafficCapture
+except ImportError:
+    from config import Settings
+    from conversation_log import ConversationLog
+    from history import ConversationHistory, NoHistory
+    from prompts import build_prompt_template
+    from resilience import CircuitBreaker
+    from retrieval import FaissStoreIndex, QueryVectorCache, RetrievalService
+    from vector_index import EmbeddingMatrixIndex, publish_index, store_fingerprint
+    from partitions import PartitionedIndex
+    from local_embeddings import LocalEmbeddings
+    from batching import QueryEmbeddingBatcher
+    from reranking import DEFAULT_THRESHOLDS, build_reranker
+    from dedup import NearDuplicateIndex
+    from prefetch import RetrievalPrefetcher
+    from executors import run_in, shutdown_executors
+    from usage import TokenUsageTracker, response_text
+    from condense import QueryCondenser
+    from user_memory import UserMemoryStore
+    from brownout import BrownoutController
+    from retrieval_client import RemoteRetrievalService
+    from index_versions import IndexStore, corpus_fingerprint, describe, embeddings_identity, embeddings_tag, identity_overrides
+    from traffic import TrafficCapture
+
+logger = logging.getLogger(__name__)
+
+
+SWAPPABLE_COMPONENTS = ("llm", "embeddings", "retriever")
+
+
+class ConfigurationError(Exception):
+    pass
+
+
+def build_llm(settings: Settings):
+    if settings.llm_provider == "ollama":
+        try:
+            from langchain_ollama import OllamaLLM as Ollama
+        except ImportError:
+            from langchain_community.llms import Ollama
+        return Ollama(model=settings.llm_model)
+
+    if settings.llm_provider == "groq":
+        api_key = os.getenv(settings.llm_api_key_env)
+        if not api_key:
+            raise ConfigurationError(f"{settings.llm_api_key_env} environment variable is required")
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model=settings.llm_model,
+            temperature=settings.llm_temperature,
+            api_key=api_key,
+            base_url=settings.llm_base_url,
+            timeout=settings.llm_max_timeout,
+            max_retries=1,
+            stream_usage=True  # usage on the final chunk of streamed responses
+        )
+
+    raise ConfigurationError(f"Unknown LLM provider '{settings.llm_provider}'")
+
+
+def build_embeddings(settings: Settings):
+    if settings.embeddings_provider == "cohere":
+        cohere_api_key = os.getenv("COHERE_API_KEY")
+        if not cohere_api_key:
+            raise ConfigurationError("COHERE_API_KEY environment variable is required for embeddings")
+        from langchain_cohere import CohereEmbeddings
+        return CohereEmbeddings(cohere_api_key=cohere_api_key, model=settings.embeddings_model)
+
+    if settings.embeddings_provider == "ollama":
+        try:
+            from langchain_ollama import OllamaEmbeddings
+        except ImportError:
+            from langchain_community.embeddings import OllamaEmbeddings
+        return OllamaEmbeddings(model=settings.embeddings_model)
+
+    if settings.embeddings_provider == "local":
+        # Slow and blocking (model load), callers run this on the maintenance pool
+        return LocalEmbeddings(
+            model_name=settings.local_embeddings_model,
+            num_threads=settings.local_embeddings_threads,
+            max_batch_size=settings.local_embeddings_batch_size,
+            max_wait_ms=settings.local_embeddings_max_wait_ms,
+            backend=settings.local_embeddings_backend,
+            onnx_file_name=settings.local_embeddings_onnx_file
+        )
+
+    raise ConfigurationError(f"Unknown embeddings provider '{settings.embeddings_provider}'")
+
+
+def build_history(settings: Settings):
+    if settings.history_provider == "none":
+        return NoHistory()
+    if settings.history_provider == "memory":
+        log = None
+        if settings.history_log_path:
+            log = ConversationLog(
+                settings.history_log_path,
+                max_queue_size=settings.history_log_queue_size,
+                batch_size=settings.history_log_batch_size
+            )
+        return ConversationHistory(window=settings.history_window, max_messages=settings.history_max_messages, log=log)
+    raise ConfigurationError(f"Unknown history provider '{settings.history_provider}'")
+
+
+class Components:
+    # Everything a deployment needs, selected by Settings. Filled in by initialize().
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.llm = None
+        self.embeddings = None
+        self.vector = None
+        self.retrieval_service: Optional[RetrievalService] = None
+        self.prefetcher: Optional[RetrievalPrefetcher] = None
+        self.condenser: Optional[QueryCondenser] = None
+        self.user_memory: Optional[UserMemoryStore] = None
+        self.prompt_template = None
+        self.history = build_history(settings)
+        self.documents = []
+        self.near_duplicates: Optional[NearDuplicateIndex] = None
+        self.index_store: Optional[IndexStore] = IndexStore(settings.index_store_path) if settings.index_store_path else None
+        self.corpus_fingerprint: Optional[str] = None
+        # Embeddings overrides still to be built when serving an older index version
+        self.pending_reindex: Optional[dict] = None
+        self.llm_usage = TokenUsageTracker()
+        self.traffic: Optional[TrafficCapture] = None
+        if settings.traffic_capture_path:
+            salt = os.getenv(settings.traffic_capture_salt_env)
+            self.traffic = TrafficCapture(settings.traffic_capture_path, settings.traffic_capture_rate, salt.encode() if salt else None)
+        self.brownout: Optional[BrownoutController] = None
+        self.brownout_llm = None
+        if settings.brownout_enabled:
+            self.brownout = BrownoutController(
+                max_in_flight=settings.brownout_max_in_flight,
+                target_p95_ms=settings.brownout_target_p95_ms,
+                window=settings.brownout_window,
+                step_interval=settings.brownout_step_interval,
+                recover_ratio=settings.brownout_recover_ratio,
+                k=settings.brownout_k,
+                max_tokens=settings.brownout_max_tokens
+            )
+        # Bumped by every install(); requests are tracked against the version they started on
+        self.version = 1
+        self.swap_lock = asyncio.Lock()
+
+        self.embeddings_breaker = CircuitBreaker(
+            "embeddings",
+            failure_threshold=settings.breaker_failure_threshold,
+            recovery_time=settings.breaker_recovery_time,
+            min_timeout=settings.embeddings_min_timeout,
+            max_timeout=settings.embeddings_max_timeout
+        )
+        self.llm_breaker = CircuitBreaker(
+            "llm",
+            failure_threshold=settings.breaker_failure_threshold,
+            recovery_time=settings.breaker_recovery_time,
+            min_timeout=settings.llm_min_timeout,
+            max_timeout=settings.llm_max_timeout
+        )
+
+        self.initialization_complete = False
+        self.initialization_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.initialization_complete and all([self.llm, self.retrieval_service, self.prompt_template])
+
+    async def initialize(self, documents: list):
+        settings = self.settings
+        self.documents = documents
+        self.initialization_complete = False
+        self.initialization_error = None
+        logger.info(f"Starting component initialization (preset: {settings.preset})...")
+
+        # LLM
+        try:
+            self.llm = build_llm(settings)
+            test_response = await self.llm.ainvoke("Hello")
+            logger.info(f"{settings.llm_provider} LLM initialized successfully: {response_text(test_response)[:50]}...")
+        except ConfigurationError as e:
+            logger.error(str(e))
+            self.initialization_error = str(e)
+            return
+        except Exception as e:
+            logger.error(f"Failed to initialize {settings.llm_provider} LLM: {e}")
+            self.initialization_error = f"{settings.llm_provider} LLM initialization failed: {str(e)}"
+            return
+
+        if self.brownout and settings.brownout_llm_model:
+            # Built but not warmed up: only used under load
+            try:
+                self.brownout_llm = build_llm(settings.model_copy(update={"llm_model": settings.brownout_llm_model}))
+            except Exception as e:
+                logger.error(f"Failed to create brownout LLM {settings.brownout_llm_model}, that level will keep the main model: {e}")
+
+        # Embeddings, vector store and retrieval service
+        if not await self.initialize_retrieval(documents):
+            return
+        try:
+            if settings.prefetch_enabled:
+                self.prefetcher = RetrievalPrefetcher(
+                    self.retrieval_service,
+                    ttl=settings.prefetch_ttl,
+                    max_users=settings.prefetch_max_users,
+                    min_overlap=settings.prefetch_min_overlap
+                )
+
+            if settings.user_memory_path:
+                # Resolved per call so a replaced retrieval service (or a re-index on the
+                # retrieval server) is picked up, embedder and model identity alike
+                self.user_memory = UserMemoryStore(
+                    lambda text: self.retrieval_service.aembed_query(text),
+                    settings.user_memory_path,
+                    lambda: self.retrieval_service.identity,
+                    max_users=settings.user_memory_max_users,
+                    k=settings.user_memory_k,
+                    min_score=settings.user_memory_min_score
+                )
+
+            if not settings.retrieval_server_url:
+                # A retrieval server may start after its workers, so it is not a startup
+                # dependency; /health reports whether it answers
+                test_docs = await self.retrieval_service.asearch("test query")
+                logger.info(f"Retrieval ready, retrieved {len(test_docs)} test documents")
+        except Exception as e:
+            logger.error(f"Failed to create vector store: {e}")
+            self.initialization_error = f"Vector store creation failed: {str(e)}"
+            return
+
+        # Query condensation
+        if settings.condense_mode != "off":
+            try:
+                self.condenser = self.build_condenser()
+                logger.info(f"Query condensation enabled ({settings.condense_mode})")
+            except Exception as e:
+                logger.error(f"Failed to create query condenser: {e}")
+                self.initialization_error = f"Query condenser creation failed: {str(e)}"
+                return
+
+        # Prompt
+        try:
+            self.prompt_template = build_prompt_template(settings.prompt, settings.prompt_layout)
+            logger.info(f"Prompt template '{settings.prompt}' ({settings.prompt_layout} layout) created successfully")
+        except Exception as e:
+            logger.error(f"Failed to create prompt template: {e}")
+            self.initialization_error = f"Prompt template creation failed: {str(e)}"
+            return
+
+        self.initialization_complete = True
+        logger.info(f"All components initialized successfully ({settings.llm_provider} LLM + {settings.embeddings_provider} embeddings)!")
+
+    async def initialize_retrieval(self, documents: list) -> bool:
+        # Embeddings, vector store and retrieval service, or a client for a shared
+        # retrieval server. Sets initialization_error and returns False on failure.
+        settings = self.settings
+        # Kept for re-index staging, including in the retrieval server, which skips initialize()
+        self.documents = documents
+        if settings.retrieval_server_url:
+            self.retrieval_service = RemoteRetrievalService(
+                settings.retrieval_server_url,
+                breaker=self.embeddings_breaker,
+                timeout=settings.embeddings_max_timeout
+            )
+            logger.info(f"Using retrieval server at {settings.retrieval_server_url}")
+            return True
+
+        if self.index_store and documents:
+            self.corpus_fingerprint = corpus_fingerprint(documents)
+            previous = self.index_store.serving_identity(settings, self.corpus_fingerprint)
+            if previous and await self.serve_previous_version(documents, previous):
+                return True
+
+        # Embeddings
+        try:
+            self.embeddings = await self.start_embeddings(settings)
+        except ConfigurationError as e:
+            logger.error(str(e))
+            self.initialization_error = str(e)
+            return False
+        except Exception as e:
+            logger.error(f"Failed to initialize {settings.embeddings_provider} embeddings: {e}")
+            self.initialization_error = f"{settings.embeddings_provider} embeddings initialization failed: {str(e)}"
+            return False
+
+        # Vector store and retrieval service
+        try:
+            logger.info(f"Creating vector store from {len(documents)} documents...")
+            if not documents:
+                logger.warning("No documents found in knowledge base")
+                self.initialization_error = "No documents found in knowledge base"
+                return False
+            self.vector, self.near_duplicates = await self.build_vector_store(documents, self.embeddings, settings)
+            self.retrieval_service = await self.build_retrieval_service(self.vector, self.embeddings, self.near_duplicates, settings)
+            if self.index_store:
+                await run_in("maintenance", self.index_store.activate, settings, self.corpus_fingerprint)
+        except Exception as e:
+            logger.error(f"Failed to create vector store: {e}")
+            self.initialization_error = f"Vector store creation failed: {str(e)}"
+            return False
+        return True
+
+    async def serve_previous_version(self, documents: list, previous: dict) -> bool:
+        # The current index version was built by another model: serve it with that
+        # model (no re-embedding) and leave building the configured one to a Reindexer
+        target = self.settings
+        settings = target.model_copy(update=identity_overrides(previous))
+        try:
+            embeddings = await self.start_embeddings(settings)
+            vector, near_duplicates = await self.build_vector_store(documents, embeddings, settings)
+            retrieval_service = await self.build_retrieval_service(vector, embeddings, near_duplicates, settings)
+        except Exception as e:
+            logger.warning(f"Cannot serve index version {describe(previous)}, building {describe(embeddings_identity(target))} now: {e}")
+            return False
+        self.embeddings, self.vector, self.near_duplicates = embeddings, vector, near_duplicates
+        self.retrieval_service = retrieval_service
+        self.settings = settings
+        self.pending_reindex = identity_overrides(embeddings_identity(target))
+        logger.info(f"Serving index version {describe(previous)} until {describe(embeddings_identity(target))} is built")
+        return True
+
+    async def start_embeddings(self, settings: Settings):
+        if settings.embeddings_provider == "local":
+            embeddings = await run_in("maintenance", build_embeddings, settings)
+        else:
+            embeddings = build_embeddings(settings)
+        test_embedding = await embeddings.aembed_query("test")
+        logger.info(f"{settings.embeddings_provider} embeddings initialized successfully (dimension: {len(test_embedding)})")
+        return embeddings
+
+    async def build_vector_store(self, documents: list, embeddings, settings: Settings) -> Tuple[object, Optional[NearDuplicateIndex]]:
+        from langchain_community.vectorstores import FAISS
+
+        # Embed with the native async client in bounded batches, build the index on the maintenance pool
+        texts = [doc.page_content for doc in documents]
+        doc_vectors = None
+        if self.index_store and self.corpus_fingerprint:
+            doc_vectors = await run_in("maintenance", self.index_store.load_vectors, settings, self.corpus_fingerprint, len(texts))
+        if doc_vectors is None:
+            batch_size = settings.index_build_batch_size
+            doc_vectors = []
+            for start in range(0, len(texts), batch_size):
+                doc_vectors.extend(await embeddings.aembed_documents(texts[start:start + batch_size]))
+            doc_vectors = np.array(doc_vectors, dtype=np.float32)
+            if self.index_store and self.corpus_fingerprint:
+                await run_in("maintenance", self.index_store.save_vectors, settings, self.corpus_fingerprint, doc_vectors)
+
+        metadatas = [doc.metadata for doc in documents]
+        near_duplicates = None
+        if settings.dedup_mode != "off":
+            # Cluster ids travel with each document (and a persisted numpy index)
+            near_duplicates = await run_in(
+                "maintenance",
+                NearDuplicateIndex.build,
+                texts,
+                doc_vectors,
+                threshold=settings.dedup_threshold,
+                mode=settings.dedup_mode,
+                mmr_lambda=settings.dedup_mmr_lambda,
+                fetch_factor=settings.dedup_fetch_factor
+            )
+            metadatas = [{**metadata, "cluster_id": near_duplicates.cluster_ids[text]} for text, metadata in zip(texts, metadatas)]
+
+        vector_store = await run_in(
+            "maintenance",
+            lambda: FAISS.from_embeddings(
+                list(zip(texts, doc_vectors)),
+                embeddings,
+                metadatas=metadatas,
+                # Unit vectors (queries too, see FaissStoreIndex), so L2 distances convert
+                # exactly to the cosine scores rerank and dedup thresholds are set in
+                normalize_L2=True
+            )
+        )
+        return vector_store, near_duplicates
+
+    async def build_retrieval_service(self, vector_store, embeddings, near_duplicates: Optional[NearDuplicateIndex], settings: Settings) -> RetrievalService:
+        # retrieval_engine=numpy serves exact search from a contiguous embedding matrix,
+        # skipping the LangChain docstore overhead (best for small/medium corpora)
+        if settings.retrieval_engine == "numpy":
+            # vector_quantization=int8|binary shrinks the resident index; with vector_index_path set
+            # the index is persisted and full-precision vectors are memory-mapped for re-ranking
+            index_kwargs = {
+                "dtype": settings.vector_dtype,
+                "quantization": settings.vector_quantization,
+                "keep_rerank_vectors": bool(settings.vector_index_path),
+                "rerank_factor": settings.vector_rerank_factor,
+            }
+            index_class = EmbeddingMatrixIndex
+            if settings.partition_by:
+                index_class = PartitionedIndex
+                index_kwargs["partition_by"] = settings.partition_by
+            if settings.vector_index_path:
+                # One directory per embedding model and build, published whole and never
+                # rewritten: other workers and a swapped-out index may still map its files
+                build = await run_in("maintenance", store_fingerprint, vector_store, index_class=index_class.__name__, **index_kwargs)
+                index_path = os.path.join(settings.vector_index_path, embeddings_tag(settings), build)
+                if not os.path.isdir(index_path):
+                    search_index = await run_in("maintenance", lambda: index_class.from_faiss(vector_store, **index_kwargs))
+                    await run_in("maintenance", publish_index, search_index, index_path)
+                search_index = await run_in("maintenance", index_class.load, index_path)
+            else:
+                search_index = await run_in("maintenance", lambda: index_class.from_faiss(vector_store, **index_kwargs))
+            logger.info(f"Using numpy retrieval engine ({search_index.quantization}/{search_index.dtype}, {search_index.nbytes / 1024:.0f} KiB resident)")
+        else:
+            if settings.partition_by:
+                logger.warning("partition_by needs retrieval_engine=numpy; the faiss engine filters after scanning the whole index")
+            search_index = FaissStoreIndex(vector_store)
+
+        retrieval_service = RetrievalService(
+            search_index,
+            embeddings,
+            k=settings.retrieval_k,
+            breaker=self.embeddings_breaker,
+            diversifier=near_duplicates,
+            query_cache=QueryVectorCache(settings.query_cache_size) if settings.query_cache_size else None,
+            identity=describe(embeddings_identity(settings))
+        )
+
+        if settings.rerank_mode != "off":
+            reranker = build_reranker(settings.rerank_mode, settings.rerank_model)
+            await run_in("maintenance", reranker.load)
+            retrieval_service.reranker = reranker
+            retrieval_service.shortlist_k = settings.rerank_shortlist_k
+            retrieval_service.min_k = settings.rerank_min_k
+            retrieval_service.rerank_threshold = (
+                settings.rerank_threshold if settings.rerank_threshold is not None else DEFAULT_THRESHOLDS[settings.rerank_mode]
+            )
+            logger.info(f"Two-stage retrieval: shortlist {settings.rerank_shortlist_k}, {reranker.name} reranker, threshold {retrieval_service.rerank_threshold}")
+
+        # Coalesce concurrent query embeddings into batched calls. Local embeddings already
+        # batch in their worker thread, so this defaults off for them. 0 disables.
+        batch_wait_ms = settings.embeddings_batch_max_wait_ms
+        if batch_wait_ms is None:
+            batch_wait_ms = 0 if settings.embeddings_provider == "local" else 3
+        if batch_wait_ms > 0:
+            retrieval_service.query_batcher = QueryEmbeddingBatcher(
+                retrieval_service.aembed_queries,
+                max_batch_size=settings.embeddings_batch_max_size,
+                max_wait_ms=batch_wait_ms
+            )
+        return retrieval_service
+
+    def build_condenser(self) -> QueryCondenser:
+        settings = self.settings
+        llm = None
+        breaker = None
+        if settings.condense_mode == "llm":
+            llm = self.llm
+            if settings.condense_llm_model:
+                llm = build_llm(settings.model_copy(update={"llm_model": settings.condense_llm_model}))
+            # Own breaker with a tight deadline: rewriting sits on the request path and a
+            # slow or failing rewrite model must not trip the main LLM circuit
+            breaker = CircuitBreaker(
+                "condense",
+                failure_threshold=settings.breaker_failure_threshold,
+                recovery_time=settings.breaker_recovery_time,
+                min_timeout=0.5,
+                max_timeout=settings.condense_max_timeout
+            )
+        return QueryCondenser(
+            mode=settings.condense_mode,
+            llm=llm,
+            breaker=breaker,
+            history_turns=settings.condense_history_turns
+        )
+
+    async def stage(self, component: str, settings: Settings) -> Dict[str, object]:
+        # Builds and warms replacements next to the live objects; nothing is installed yet
+        if component == "llm":
+            llm = build_llm(settings)
+            await llm.ainvoke("Hello")
+            return {"llm": llm}
+        if isinstance(self.retrieval_service, RemoteRetrievalService):
+            raise ValueError(f"The {component} is owned by the retrieval server at {self.settings.retrieval_server_url}, swap it there")
+        if component == "embeddings":
+            embeddings = await self.start_embeddings(settings)
+            vector, near_duplicates = await self.build_vector_store(self.documents, embeddings, settings)
+        elif component == "retriever":
+            # Same embeddings, vector store and near-duplicate clusters; new search side
+            embeddings, vector, near_duplicates = self.embeddings, self.vector, self.near_duplicates
+        else:
+            raise ValueError(f"Unknown component '{component}', expected one of {SWAPPABLE_COMPONENTS}")
+        retrieval_service = await self.build_retrieval_service(vector, embeddings, near_duplicates, settings)
+        await retrieval_service.asearch("test query")
+        return {"embeddings": embeddings, "vector": vector, "near_duplicates": near_duplicates, "retrieval_service": retrieval_service}
+
+    def install(self, staged: Dict[str, object], settings: Settings) -> Tuple[int, Dict[str, object]]:
+        # Synchronous, so no request can observe a half-installed set. Returns the
+        # version being replaced and the objects to retire once its requests finish.
+        replaced = {name: getattr(self, name) for name in staged}
+        for name, value in staged.items():
+            setattr(self, name, value)
+        self.settings = settings
+        if "llm" in staged and self.condenser and settings.condense_mode == "llm" and not settings.condense_llm_model:
+            self.condenser.llm = self.llm
+        if "retrieval_service" in staged and self.prefetcher:
+            self.prefetcher.retrieval_service = self.retrieval_service
+            self.prefetcher.clear()
+        if "embeddings" in staged:
+            self.pending_reindex = None
+        old_version = self.version
+        self.version += 1
+        return old_version, replaced
+
+    async def activate_index(self, settings: Settings):
+        # The manifest follows the live version once installed; a crash before this
+        # re-serves the old one. Writing it fsyncs and prunes old versions, so off the loop.
+        if self.index_store and self.corpus_fingerprint:
+            await run_in("maintenance", self.index_store.activate, settings, self.corpus_fingerprint)
+
+    async def retire(self, replaced: Dict[str, object]):
+        retrieval_service = replaced.get("retrieval_service")
+        if retrieval_service and retrieval_service.query_batcher:
+            await retrieval_service.query_batcher.close()
+        embeddings = replaced.get("embeddings")
+        if isinstance(embeddings, LocalEmbeddings) and embeddings is not self.embeddings:
+            embeddings.close()
+
+    async def flush(self):
+        await self.history.flush()
+        if self.user_memory:
+            await self.user_memory.flush()
+        if self.traffic:
+            await self.traffic.flush()
+        if self.prefetcher:
+            self.prefetcher.clear()
+
+    async def close(self):
+        if self.prefetcher:
+            self.prefetcher.close()
+        # Flush the conversation log, pending memory writes and traffic records while the storage pool still runs
+        await self.history.close()
+        if self.user_memory:
+            await self.user_memory.close()
+        if self.traffic:
+            await self.traffic.close()
+        if self.retrieval_service and self.retrieval_service.query_batcher:
+            await self.retrieval_service.query_batcher.close()
+        if isinstance(self.retrieval_service, RemoteRetrievalService):
+            await self.retrieval_service.close()
+        if isinstance(self.embeddings, LocalEmbeddings):
+            self.embeddings.close()
+        shutdown_executors()
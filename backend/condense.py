@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+try:
+    from .keywords import extract_keywords, tokenize
+    from .usage import response_text
+except ImportError:
+    from keywords import extract_keywords, tokenize
+    from usage import response_text
+
+logger = logging.getLogger(__name__)
+
+# Words that point back at earlier turns instead of naming a topic
+REFERENCE_WORDS = frozenset("it that this those these them they there more again else same above".split())
+
+CONDENSE_PROMPT = """Rewrite the user's latest message as a short, standalone search query for a mental health knowledge base. Use the conversation only to resolve what the message refers to. Reply with the query only.
+
+Conversation:
+{history}
+Latest message: {message}
+
+Standalone query:"""
+
+
+class QueryCondenser:
+    # Turns context-dependent follow-ups ("how do I do that?") into standalone
+    # retrieval queries using the recent turns. "heuristic" appends topic keywords
+    # from the previous exchange; "llm" asks a (small) model and falls back to the
+    # heuristic on failure. Only retrieval sees the rewritten query; the LLM still
+    # answers the original message. Rewrites are cached per (message, recent turns).
+    def __init__(
+        self,
+        mode: str = "heuristic",
+        llm=None,
+        breaker=None,
+        history_turns: int = 2,
+        min_keywords: int = 3,
+        cache_size: int = 1024,
+    ):
+        if mode not in ("heuristic", "llm"):
+            raise ValueError(f"Unknown condense mode '{mode}'")
+        if mode == "llm" and llm is None:
+            raise ValueError("condense mode 'llm' requires an LLM")
+        self.mode = mode
+        self.llm = llm
+        self.breaker = breaker
+        self.history_turns = history_turns
+        self.min_keywords = min_keywords
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[Tuple[str, Tuple[str, ...]], str]" = OrderedDict()
+
+        self.calls = 0
+        self.attempted = 0
+        self.rewritten = 0
+        self.cache_hits = 0
+        self.llm_failures = 0
+        self.total_time = 0.0
+        # Generation length by whether retrieval used a rewritten query, to weigh
+        # the added latency against shorter answers
+        self.response_chars = {"rewritten": [0, 0], "original": [0, 0]}
+
+    def needs_rewrite(self, message: str) -> bool:
+        words = tokenize(message)
+        return len(extract_keywords(message)) < self.min_keywords or any(word in REFERENCE_WORDS for word in words)
+
+    def heuristic_rewrite(self, message: str, previous_messages: List[dict]) -> str:
+        topics = extract_keywords(" ".join(msg["message"] for msg in previous_messages))
+        own_keywords = set(extract_keywords(message))
+        additions = [topic for topic in topics if topic not in own_keywords]
+        return f"{message} {' '.join(additions)}" if additions else message
+
+    async def llm_rewrite(self, message: str, previous_messages: List[dict]) -> str:
+        history = "".join(f"{'User' if msg['is_user'] else 'MindScribe'}: {msg['message']}\n" for msg in previous_messages)
+        prompt = CONDENSE_PROMPT.format(history=history, message=message)
+        if self.breaker:
+            result = await self.breaker.call(self.llm.ainvoke, prompt)
+        else:
+            result = await self.llm.ainvoke(prompt)
+        query = response_text(result).strip().strip('"').splitlines()
+        return query[0].strip() if query and query[0].strip() else message
+
+    async def condense(self, message: str, previous_messages: List[dict]) -> str:
+        self.calls += 1
+        previous_messages = previous_messages[-2 * self.history_turns:]
+        if not previous_messages or not self.needs_rewrite(message):
+            return message
+
+        self.attempted += 1
+        start_time = time.monotonic()
+        key = (message.strip().lower(), tuple(msg["message"] for msg in previous_messages))
+        condensed = self.cache.get(key)
+        if condensed is not None:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+        else:
+            if self.mode == "llm":
+                try:
+                    condensed = await self.llm_rewrite(message, previous_messages)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.llm_failures += 1
+                    logger.warning(f"LLM query condensation failed, using heuristic: {e}")
+            if condensed is None:
+                condensed = self.heuristic_rewrite(message, previous_messages)
+            self.cache[key] = condensed
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self.total_time += time.monotonic() - start_time
+
+        if condensed != message:
+            self.rewritten += 1
+            logger.info(f"Condensed query: {message[:60]!r} -> {condensed[:100]!r}")
+        return condensed
+
+    def record_response(self, rewritten: bool, response: str):
+        totals = self.response_chars["rewritten" if rewritten else "original"]
+        totals[0] += 1
+        totals[1] += len(response)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "calls": self.calls,
+            "attempted": self.attempted,
+            "rewritten": self.rewritten,
+            "cache_hits": self.cache_hits,
+            "cache_size": len(self.cache),
+            "llm_failures": self.llm_failures,
+            "breaker": self.breaker.snapshot() if self.breaker else None,
+            "avg_condense_ms": round(1000 * self.total_time / self.attempted, 2) if self.attempted else None,
+            "avg_response_chars": {
+                name: round(total / count, 1) if count else None
+                for name, (count, total) in self.response_chars.items()
+            },
+        }
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+from typing import Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class Settings(BaseModel):
+    # Every field can be overridden by a MINDSCRIBE_<FIELD> environment variable
+    # (e.g. MINDSCRIBE_RETRIEVAL_K=3). Precedence: preset < config file < env.
+    preset: str = "groq"
+
+    # LLM
+    llm_provider: str = "groq"  # groq (OpenAI-compatible) | ollama
+    llm_model: str = "openai/gpt-oss-120b"
+    llm_temperature: float = 0.7
+    llm_base_url: Optional[str] = "https://api.groq.com/openai/v1"
+    llm_api_key_env: str = "GOOGLE_API_KEY"  # Using same env var as before
+    llm_min_timeout: float = 5.0
+    llm_max_timeout: float = 60.0
+
+    # Embeddings
+    embeddings_provider: str = "cohere"  # cohere | ollama | local
+    embeddings_model: str = "embed-english-v3.0"
+    embeddings_min_timeout: float = 1.0
+    embeddings_max_timeout: float = 10.0
+    embeddings_batch_max_wait_ms: Optional[float] = None  # None: 3ms unless embeddings batch locally
+    embeddings_batch_max_size: int = 32
+    index_build_batch_size: int = 96  # documents per embeddings call when building the index
+    local_embeddings_model: str = "all-MiniLM-L6-v2"
+    local_embeddings_threads: int = 2
+    local_embeddings_batch_size: int = 32
+    local_embeddings_max_wait_ms: float = 2.0
+    local_embeddings_backend: str = "torch"
+    local_embeddings_onnx_file: Optional[str] = None
+
+    # Retrieval
+    retrieval_engine: str = "faiss"  # faiss | numpy
+    retrieval_k: int = 5
+    vector_dtype: str = "float32"
+    vector_quantization: str = "none"
+    vector_index_path: Optional[str] = None
+    vector_rerank_factor: int = 4
+    # Per-partition sub-indexes keyed by a metadata field (numpy engine); searches filtered
+    # on that field only scan the matching partitions
+    partition_by: Optional[str] = None  # topic | source_site
+    partition_routing: str = "off"  # off | auto: restrict retrieval to the topics a query mentions
+    # Two-stage retrieval: shortlist, rerank, then keep only passages above the threshold
+    # (retrieval_k becomes the upper bound)
+    rerank_mode: str = "off"  # off | hybrid | cross_encoder
+    rerank_model: Optional[str] = None  # cross-encoder name, see reranking.DEFAULT_CROSS_ENCODER
+    rerank_shortlist_k: int = 20
+    rerank_threshold: Optional[float] = None  # None: reranking.DEFAULT_THRESHOLDS for the mode
+    rerank_min_k: int = 1
+    # Near-duplicate clustering at index time, diversified results at query time
+    dedup_mode: str = "off"  # off | cluster | mmr
+    dedup_threshold: float = 0.92  # cosine at or above which passages are near-duplicates
+    dedup_mmr_lambda: float = 0.7
+    dedup_fetch_factor: int = 3  # candidates searched per result when not reranking
+
+    # Versioned document embeddings, one version per embedding model and corpus. A
+    # restart on the same model loads them instead of re-embedding; after a model
+    # change the previous version keeps serving while the new one is built in the
+    # background, then cut over (see index_versions.Reindexer)
+    index_store_path: Optional[str] = None
+    reindex_cutover: str = "auto"  # auto | manual (POST /admin/reindex/cutover)
+    reindex_dual_read_rate: float = 0.0  # share of live searches repeated on the candidate index
+    reindex_dual_read_samples: int = 50
+    reindex_dual_read_timeout: float = 600.0  # seconds an auto cutover waits for those samples
+
+    # Shared retrieval: with retrieval_server_url set ("unix:///path.sock" or
+    # "http://host:port"), workers hold no embeddings or index and query a
+    # retrieval_server.py process instead
+    retrieval_server_url: Optional[str] = None
+    query_cache_size: Optional[int] = None  # LRU of query embeddings; None: off in workers, 10000 in the retrieval server
+
+    # Speculative retrieval for a returning user's next turn
+    prefetch_enabled: bool = False
+    prefetch_ttl: float = 120.0
+    prefetch_min_overlap: float = 0.5  # share of the new message's keywords a prefetched search must cover
+    prefetch_max_users: int = 1000
+
+    # Conversation-aware query rewriting for retrieval
+    condense_mode: str = "off"  # off | heuristic | llm
+    condense_llm_model: Optional[str] = None  # cheaper model on the same provider; None reuses llm_model
+    condense_max_timeout: float = 3.0
+    condense_history_turns: int = 2
+
+    # Circuit breakers
+    breaker_failure_threshold: int = 3
+    breaker_recovery_time: float = 30.0
+
+    # Conversation history
+    history_provider: str = "memory"  # memory | none
+    history_window: int = 6
+    history_max_messages: int = 20
+    history_log_path: Optional[str] = None  # SQLite file; persists turns and rehydrates them after restarts
+    history_log_queue_size: int = 10000
+    history_log_batch_size: int = 256
+
+    # Per-user long-term memory: vector recall over a user's past messages and journal entries
+    user_memory_path: Optional[str] = None  # directory of per-user indexes; None disables
+    user_memory_max_users: int = 256  # users kept loaded, least recently used evicted first
+    user_memory_k: int = 3
+    user_memory_min_score: float = 0.35
+
+    # Prompt and response shaping
+    prompt: str = "therapist"  # see prompts.PROMPT_TEMPLATES
+    prompt_layout: str = "inline"  # inline | cache_friendly (static system message first, for provider prefix caching)
+    fast_paths: bool = True  # canned replies for greetings / empty messages
+    stream_mode: str = "full"  # full: one chunk | words: word-by-word
+    stream_word_delay: float = 0.03
+    include_sources: bool = False  # append ---SOURCES--- and a JSON list of doc metadata
+
+    # Brownout: degrade step by step (smaller k, no history, capped tokens, cheaper
+    # model, canned replies) while in-flight requests or p95 latency exceed their targets
+    brownout_enabled: bool = False
+    brownout_max_in_flight: int = 32
+    brownout_target_p95_ms: float = 8000.0
+    brownout_window: float = 30.0  # seconds of latencies the percentiles cover
+    brownout_step_interval: float = 5.0  # minimum seconds between level changes
+    brownout_recover_ratio: float = 0.6  # step back down once pressure falls below this
+    brownout_k: int = 2
+    brownout_max_tokens: int = 300
+    brownout_llm_model: Optional[str] = None  # cheaper model on the same provider; None skips that step's model change
+
+    # Graceful drain (SIGTERM or /admin/drain) and hot-swap retirement deadline
+    drain_timeout: float = 30.0
+
+    # Admin and profiling. Admin endpoints are disabled unless the admin_token_env
+    # variable is set; requests must send it as X-Admin-Token.
+    admin_token_env: str = "MINDSCRIBE_ADMIN_SECRET"
+    profile_sample_rate: float = 0.0  # share of requests captured with cProfile
+    profile_max_results: int = 20
+    loop_stall_threshold_ms: float = 0.0  # report event loop stalls longer than this; 0 disables
+
+    # Anonymized capture of /chat request shapes for replay.py (no message text or user ids)
+    traffic_capture_path: Optional[str] = None  # directory; None disables
+    traffic_capture_rate: float = 1.0  # share of users captured
+    traffic_capture_salt_env: str = "MINDSCRIBE_TRAFFIC_SALT"  # shared by workers so pseudonyms match; unset: random per process
+
+    # Batch API
+    max_batch_items: int = 5000
+    max_batch_concurrency: int = 32
+
+    description: str = "RAG with Cloud Embeddings"
+    version: str = "2.2.0"
+
+
+# Deployment modes previously implemented as separate app modules
+PRESETS = {
+    # backend/main.py: Groq LLM + Cohere embeddings, therapist prompt with history
+    "groq": {},
+    # backend/main_simple.py: local Ollama gemma:2b, supportive-listener prompt
+    "ollama": {
+        "llm_provider": "ollama",
+        "llm_model": "gemma:2b",
+        "llm_base_url": None,
+        "llm_api_key_env": "",
+        "llm_max_timeout": 30.0,
+        "embeddings_provider": "ollama",
+        "embeddings_model": "gemma:2b",
+        "embeddings_max_timeout": 30.0,
+        "index_build_batch_size": 10,
+        "retrieval_k": 3,
+        "history_provider": "none",
+        "prompt": "listener",
+        "fast_paths": False,
+        "stream_mode": "words",
+        "stream_word_delay": 0.03,
+        "include_sources": True,
+        "description": "RAG with local Ollama",
+        "version": "1.0.0",
+    },
+    # backend/main_simple_rag.py: as above with the softer RAG prompt
+    "ollama_rag": {
+        "llm_provider": "ollama",
+        "llm_model": "gemma:2b",
+        "llm_base_url": None,
+        "llm_api_key_env": "",
+        "llm_max_timeout": 60.0,
+        "embeddings_provider": "ollama",
+        "embeddings_model": "gemma:2b",
+        "embeddings_max_timeout": 30.0,
+        "retrieval_k": 3,
+        "history_provider": "none",
+        "prompt": "listener_rag",
+        "fast_paths": False,
+        "stream_mode": "words",
+        "stream_word_delay": 0.05,
+        "include_sources": True,
+        "description": "RAG with local Ollama",
+        "version": "1.0.0",
+    },
+}
+
+
+def load_settings(preset: Optional[str] = None, config_path: Optional[str] = None) -> Settings:
+    preset = preset or os.getenv("MINDSCRIBE_PRESET", "groq")
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preset '{preset}', expected one of {sorted(PRESETS)}")
+    values = {"preset": preset, **PRESETS[preset]}
+
+    config_path = os.getenv("MINDSCRIBE_CONFIG", config_path)
+    if config_path:
+        with open(config_path) as f:
+            values.update(json.load(f))
+        logger.info(f"Loaded settings from {config_path}")
+
+    for name in Settings.model_fields:
+        if name == "preset":
+            continue
+        env_value = os.getenv(f"MINDSCRIBE_{name.upper()}")
+        if env_value:
+            values[name] = env_value
+
+    return Settings(**values)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+try:
+    from .executors import run_in
+except ImportError:
+    from executors import run_in
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    is_user INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_user_id ON messages (user_id, id);
+"""
+
+
+class ConversationLog:
+    # Durable append-only log of every conversation turn, in SQLite (WAL mode).
+    # Requests only enqueue; a background task drains the bounded queue and writes
+    # in batches on the storage pool. A full queue makes append() wait (backpressure)
+    # rather than dropping turns.
+    def __init__(self, path: str, max_queue_size: int = 10000, batch_size: int = 256):
+        self.path = path
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+        self.appended = 0
+        self.written = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.backpressure_waits = 0
+        self.max_queue_depth = 0
+        self.total_write_time = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL only fsyncs at checkpoints; a power loss can lose the last
+            # few batches but never corrupts the log
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+            logger.info(f"Opened conversation log at {self.path}")
+        return self._connection
+
+    def _ensure_started(self):
+        # One queue for the log's lifetime, so rows queued around a flush are never dropped
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_behind())
+
+    async def append(self, user_id: str, message: str, is_user: bool, timestamp: float):
+        self._ensure_started()
+        item = (user_id, int(is_user), message, timestamp)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.backpressure_waits += 1
+            await self._queue.put(item)
+        self.appended += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    async def _write_behind(self):
+        # After a flush sentinel, keeps writing until the queue is empty
+        stopping = False
+        while True:
+            if stopping and self._queue.empty():
+                return
+            item = await self._queue.get()
+            if item is None:
+                stopping = True
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    continue
+                batch.append(item)
+
+            try:
+                await run_in("storage", self._write_batch, batch)
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"Failed to write {len(batch)} conversation log entries: {e}")
+
+    def _write_batch(self, batch: List[Tuple[str, int, str, float]]):
+        start_time = time.monotonic()
+        with self._connection_lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO messages (user_id, is_user, message, timestamp) VALUES (?, ?, ?, ?)",
+                    batch
+                )
+        self.written += len(batch)
+        self.batches += 1
+        self.total_write_time += time.monotonic() - start_time
+
+    def _read_recent(self, user_id: str, limit: int) -> List[dict]:
+        with self._connection_lock:
+            rows = self._connect().execute(
+                "SELECT message, is_user, timestamp FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [{"message": message, "is_user": bool(is_user), "timestamp": timestamp} for message, is_user, timestamp in reversed(rows)]
+
+    async def recent(self, user_id: str, limit: int) -> List[dict]:
+        return await run_in("storage", self._read_recent, user_id, limit)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "max_queue_depth": self.max_queue_depth,
+            "appended": self.appended,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else None,
+            "avg_write_ms": round(1000 * self.total_write_time / self.batches, 2) if self.batches else None,
+            "backpressure_waits": self.backpressure_waits,
+            "write_errors": self.write_errors,
+        }
+
+    async def flush(self):
+        # Write everything queued so far, including rows appended while flushing; the
+        # writer restarts on the next append
+        while (self._writer and not self._writer.done()) or (self._queue and not self._queue.empty()):
+            self._ensure_started()
+            await self._queue.put(None)
+            await self._writer
+        self._writer = None
+
+    async def close(self):
+        await self.flush()
+        with self._connection_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
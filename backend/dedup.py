@@ -0,0 +1,146 @@
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    from .vector_index import normalize_rows, top_k
+except ImportError:
+    from vector_index import normalize_rows, top_k
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ("cluster", "mmr")
+SIMILARITY_BLOCK_ROWS = 1024
+
+
+def find_root(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+class NearDuplicateIndex:
+    # Built once at index time from the document embeddings:
+    #   cluster_ids - connected components of pairs with cosine >= threshold; stored
+    #                 on each document's metadata as "cluster_id"
+    #   neighbors   - each document's most similar documents, a sparse stand-in for
+    #                 the pairwise similarity matrix
+    # Query time never touches vectors: "cluster" keeps the best passage per cluster,
+    # "mmr" runs maximal marginal relevance with similarities looked up in neighbors
+    # (anything not listed counts as dissimilar).
+    def __init__(
+        self,
+        cluster_ids: Dict[str, int],
+        neighbors: Dict[str, Dict[str, float]],
+        mode: str = "cluster",
+        mmr_lambda: float = 0.7,
+        fetch_factor: int = 3,
+    ):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode '{mode}', expected one of {DEDUP_MODES}")
+        self.cluster_ids = cluster_ids
+        self.neighbors = neighbors
+        self.mode = mode
+        self.mmr_lambda = mmr_lambda
+        self.fetch_factor = fetch_factor
+        self.queries = 0
+        self.plain_duplicates = 0
+
+    @classmethod
+    def build(
+        cls,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        threshold: float = 0.92,
+        neighbor_k: int = 10,
+        neighbor_min_similarity: float = 0.5,
+        **kwargs
+    ) -> "NearDuplicateIndex":
+        # O(n^2) similarities, computed once in row blocks to bound memory
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        count = len(matrix)
+        parent = np.arange(count)
+        neighbors: Dict[str, Dict[str, float]] = {}
+        neighbor_k = min(neighbor_k, max(0, count - 1))
+        for start in range(0, count, SIMILARITY_BLOCK_ROWS):
+            block = matrix[start:start + SIMILARITY_BLOCK_ROWS] @ matrix.T
+            for offset in range(len(block)):
+                block[offset, start + offset] = -np.inf
+
+            rows, cols = np.nonzero(block >= threshold)
+            for row, col in zip(rows + start, cols):
+                root_a, root_b = find_root(parent, row), find_root(parent, col)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+            if neighbor_k:
+                best_scores, best_cols = top_k(block, neighbor_k)
+                for offset, (row_scores, row_cols) in enumerate(zip(best_scores, best_cols)):
+                    neighbors[texts[start + offset]] = {
+                        texts[col]: float(score) for score, col in zip(row_scores, row_cols) if score >= neighbor_min_similarity
+                    }
+
+        roots = [find_root(parent, i) for i in range(count)]
+        labels: Dict[int, int] = {}
+        cluster_ids = {text: labels.setdefault(root, len(labels)) for text, root in zip(texts, roots)}
+        logger.info(f"Clustered {count} documents into {len(labels)} near-duplicate clusters (threshold {threshold})")
+        return cls(cluster_ids, neighbors, **kwargs)
+
+    @property
+    def cluster_count(self) -> int:
+        return len(set(self.cluster_ids.values()))
+
+    def cluster_of(self, doc: Document) -> int:
+        cluster_id = doc.metadata.get("cluster_id")
+        if cluster_id is None:
+            # Unknown documents are their own cluster
+            return self.cluster_ids.get(doc.page_content, -1 - id(doc))
+        return cluster_id
+
+    def similarity(self, a: Document, b: Document) -> float:
+        if self.cluster_of(a) == self.cluster_of(b):
+            return 1.0
+        return self.neighbors.get(a.page_content, {}).get(b.page_content, 0.0)
+
+    def select(self, scored: List[Tuple[Document, float]], k: int) -> List[Tuple[Document, float]]:
+        # scored is ordered by relevance, best first
+        self.queries += 1
+        if self.mode == "cluster":
+            seen = set()
+            selected = []
+            for doc, score in scored:
+                cluster_id = self.cluster_of(doc)
+                if cluster_id in seen:
+                    continue
+                seen.add(cluster_id)
+                selected.append((doc, score))
+                if len(selected) == k:
+                    break
+        else:
+            remaining = list(scored)
+            selected = []
+            while remaining and len(selected) < k:
+                best = max(
+                    range(len(remaining)),
+                    key=lambda i: self.mmr_lambda * remaining[i][1] - (1.0 - self.mmr_lambda) * max(
+                        (self.similarity(remaining[i][0], doc) for doc, _ in selected), default=0.0
+                    )
+                )
+                selected.append(remaining.pop(best))
+
+        # Near-duplicates a plain top-k of the same size would have sent to the LLM
+        plain = scored[:len(selected)]
+        self.plain_duplicates += len(plain) - len({self.cluster_of(doc) for doc, _ in plain})
+        return selected
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "documents": len(self.cluster_ids),
+            "clusters": self.cluster_count,
+            "queries": self.queries,
+            "plain_top_k_duplicates": self.plain_duplicates,
+        }
@@ -3,7 +3,7 @@ import os
 
 def download_model():
     print("Pre-downloading SentenceTransformer model...")
-    # This matches the model used in main.py: "all-MiniLM-L6-v2"
+    # This matches the local embeddings model (MINDSCRIBE_EMBEDDINGS_PROVIDER=local): "all-MiniLM-L6-v2"
     model = SentenceTransformer('all-MiniLM-L6-v2')
     print("Model downloaded successfully.")
 
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Separate pools so slow blocking network clients can't starve fast index lookups:
+#   search      - CPU-bound vector search (FAISS / numpy)
+#   network     - blocking SDK calls that have no async equivalent
+#   maintenance - index builds, persistence and other background work
+#   storage     - conversation log reads/writes (single worker: owns the SQLite connection)
+DEFAULT_POOL_SIZES = {
+    "search": min(4, os.cpu_count() or 1),
+    "network": 16,
+    "maintenance": 1,
+    "storage": 1,
+}
+
+
+class InstrumentedExecutor:
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.total_queue_wait = 0.0
+        self.total_run_time = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        submitted_at = time.monotonic()
+        with self._lock:
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        def task():
+            started_at = time.monotonic()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_queue_wait += started_at - submitted_at
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run_time += time.monotonic() - started_at
+
+        future = self._pool.submit(task)
+        future.add_done_callback(self._dequeue_cancelled)
+        return future
+
+    def _dequeue_cancelled(self, future: Future):
+        # Cancelled while still queued (e.g. a timed-out await), so task() never ran
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_queue_wait_ms": round(1000 * self.total_queue_wait / self.completed, 2) if self.completed else None,
+                "avg_run_ms": round(1000 * self.total_run_time / self.completed, 2) if self.completed else None,
+            }
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+executors: Dict[str, InstrumentedExecutor] = {}
+
+
+def get_executor(name: str) -> InstrumentedExecutor:
+    if name not in executors:
+        if name not in DEFAULT_POOL_SIZES:
+            raise KeyError(f"Unknown executor '{name}'")
+        size = int(os.getenv(f"EXECUTOR_{name.upper()}_WORKERS", DEFAULT_POOL_SIZES[name]))
+        executors[name] = InstrumentedExecutor(name, size)
+        logger.info(f"Created '{name}' executor with {size} workers")
+    return executors[name]
+
+
+async def run_in(name: str, fn: Callable, *args, **kwargs):
+    return await get_executor(name).run(fn, *args, **kwargs)
+
+
+def executor_stats() -> dict:
+    return {name: executor.stats() for name, executor in executors.items()}
+
+
+def shutdown_executors(wait: bool = False):
+    for executor in executors.values():
+        executor.shutdown(wait=wait)
+    executors.clear()
@@ -0,0 +1,136 @@
+import logging
+import time
+from typing import Dict, List, Optional, Set
+
+try:
+    from .conversation_log import ConversationLog
+except ImportError:
+    from conversation_log import ConversationLog
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationHistory:
+    # In-memory per-user conversation window, optionally backed by a durable log.
+    # With a log, every turn is also appended to it (write-behind), and a user's
+    # recent turns are hydrated from it on their first message after a restart.
+    def __init__(self, window: int = 6, max_messages: int = 20, log: Optional[ConversationLog] = None):
+        self.window = window
+        self.max_messages = max_messages
+        self.log = log
+        self.conversations: Dict[str, List[dict]] = {}
+        self.hydrated: Set[str] = set()
+        # Each message is rendered once when added; the joined window is cached per
+        # user and only rebuilt when that user's conversation changes
+        self.rendered: Dict[str, List[str]] = {}
+        self.context_cache: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    def get_context(self, user_id: str) -> str:
+        if not user_id or user_id not in self.conversations:
+            return ""
+
+        context_string = self.context_cache.get(user_id)
+        if context_string is None:
+            rendered = self.rendered[user_id]
+            context_string = "".join(rendered[-self.window:] if len(rendered) > self.window else rendered)
+            self.context_cache[user_id] = context_string
+        return context_string
+
+    def recent_messages(self, user_id: str, count: int) -> List[dict]:
+        history = self.conversations.get(user_id) if user_id else None
+        return history[-count:] if history else []
+
+    async def aget_context(self, user_id: str) -> str:
+        if self.log and user_id and user_id not in self.hydrated:
+            await self.hydrate(user_id)
+        return self.get_context(user_id)
+
+    async def hydrate(self, user_id: str):
+        # Marked up front so concurrent first messages don't load the same user twice
+        self.hydrated.add(user_id)
+        try:
+            persisted = await self.log.recent(user_id, self.max_messages)
+        except Exception as e:
+            logger.error(f"Failed to hydrate conversation history for {user_id}: {e}")
+            return
+        if not persisted:
+            return
+
+        # Turns added while the read was in flight are newer than anything persisted
+        messages = (persisted + self.conversations.get(user_id, []))[-self.max_messages:]
+        self.conversations[user_id] = messages
+        self.rendered[user_id] = [f"{'User' if msg['is_user'] else 'MindScribe'}: {msg['message']}\n" for msg in messages]
+        self.context_cache.pop(user_id, None)
+        logger.info(f"Hydrated {len(persisted)} persisted messages for {user_id}")
+
+    async def aadd(self, user_id: str, message: str, is_user: bool):
+        timestamp = self.add(user_id, message, is_user)
+        if self.log and timestamp is not None:
+            await self.log.append(user_id, message, is_user, timestamp)
+
+    def add(self, user_id: str, message: str, is_user: bool) -> Optional[float]:
+        if not user_id:
+            return None
+
+        if user_id not in self.conversations:
+            self.conversations[user_id] = []
+            self.rendered[user_id] = []
+
+        timestamp = time.time()
+        self.conversations[user_id].append({
+            "message": message,
+            "is_user": is_user,
+            "timestamp": timestamp
+        })
+        role = "User" if is_user else "MindScribe"
+        self.rendered[user_id].append(f"{role}: {message}\n")
+
+        if len(self.conversations[user_id]) > self.max_messages:
+            self.conversations[user_id] = self.conversations[user_id][-self.max_messages:]
+            self.rendered[user_id] = self.rendered[user_id][-self.max_messages:]
+        self.context_cache.pop(user_id, None)
+        return timestamp
+
+    def stats(self) -> Optional[dict]:
+        return self.log.stats() if self.log else None
+
+    async def flush(self):
+        if self.log:
+            await self.log.flush()
+
+    async def close(self):
+        if self.log:
+            await self.log.close()
+
+
+class NoHistory:
+    # Stateless deployments (the Ollama presets never tracked history)
+    def __len__(self) -> int:
+        return 0
+
+    def get_context(self, user_id: str) -> str:
+        return ""
+
+    async def aget_context(self, user_id: str) -> str:
+        return ""
+
+    def recent_messages(self, user_id: str, count: int) -> List[dict]:
+        return []
+
+    def add(self, user_id: str, message: str, is_user: bool):
+        pass
+
+    async def aadd(self, user_id: str, message: str, is_user: bool):
+        pass
+
+    def stats(self) -> Optional[dict]:
+        return None
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
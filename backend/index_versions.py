@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from typing import Callable, IO, List, Optional, Set
+
+import numpy as np
+from pydantic import BaseModel
+
+try:
+    from .config import Settings
+except ImportError:
+    from config import Settings
+
+logger = logging.getLogger(__name__)
+
+VERSION_FORMAT = 1
+MANIFEST_FILE = "CURRENT.json"
+VERSION_FILE = "version.json"
+VECTORS_FILE = "vectors.npy"
+CUTOVER_MODES = ("auto", "manual")
+# Settings that decide which model embeds the documents
+EMBEDDINGS_FIELDS = ("embeddings_provider", "embeddings_model", "local_embeddings_model")
+
+
+def embeddings_identity(settings: Settings) -> dict:
+    model = settings.local_embeddings_model if settings.embeddings_provider == "local" else settings.embeddings_model
+    return {"provider": settings.embeddings_provider, "model": model}
+
+
+def identity_overrides(identity: dict) -> dict:
+    if identity["provider"] == "local":
+        return {"embeddings_provider": "local", "local_embeddings_model": identity["model"]}
+    return {"embeddings_provider": identity["provider"], "embeddings_model": identity["model"]}
+
+
+def describe(identity: dict) -> str:
+    return f"{identity['provider']}:{identity['model']}"
+
+
+def embeddings_tag(settings: Settings) -> str:
+    # Directory-safe name for the model, e.g. "cohere-embed-english-v3.0"
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", describe(embeddings_identity(settings)).replace(":", "-")).strip("-")
+
+
+def corpus_fingerprint(documents: list) -> str:
+    digest = hashlib.sha256()
+    for doc in documents:
+        digest.update(json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+class IndexStore:
+    # Document embeddings persisted per (embedding model, corpus) version:
+    #   <root>/<model tag>-<fingerprint>/vectors.npy + version.json (written last)
+    #   <root>/CURRENT.json names the version being served, replaced atomically
+    # A restart with the same model and corpus loads its vectors instead of
+    # re-embedding; a restart with a different model keeps serving the current
+    # version while the new one is built (see Reindexer).
+    def __init__(self, root: str, keep_versions: int = 2):
+        self.root = root
+        self.keep_versions = keep_versions
+        self.loads = 0
+        self.saves = 0
+        os.makedirs(root, exist_ok=True)
+
+    def tag(self, settings: Settings, fingerprint: str) -> str:
+        return f"{embeddings_tag(settings)}-{fingerprint}"
+
+    def _read_json(self, path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {path}: {e}")
+            return None
+
+    def _write_atomic(self, path: str, write: Callable[[IO], None], mode: str = "w"):
+        # Unique temp file in the same directory, fsynced, then renamed over path, so
+        # concurrent writers (workers starting together) never share or expose a partial file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+        try:
+            with os.fdopen(fd, mode) as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def current(self) -> Optional[dict]:
+        return self._read_json(os.path.join(self.root, MANIFEST_FILE))
+
+    def version(self, tag: str) -> Optional[dict]:
+        meta = self._read_json(os.path.join(self.root, tag, VERSION_FILE))
+        if meta and meta.get("format_version") != VERSION_FORMAT:
+            return None
+        return meta
+
+    def serving_identity(self, settings: Settings, fingerprint: str) -> Optional[dict]:
+        # The model of the current version when it is not the configured one but was
+        # built from this same corpus, so it can keep serving during a re-index
+        current = self.current()
+        if not current or current.get("fingerprint") != fingerprint:
+            return None
+        if current["embeddings"] == embeddings_identity(settings) or not self.version(current["tag"]):
+            return None
+        return current["embeddings"]
+
+    def load_vectors(self, settings: Settings, fingerprint: str, count: int) -> Optional[np.ndarray]:
+        tag = self.tag(settings, fingerprint)
+        meta = self.version(tag)
+        if not meta or meta["count"] != count:
+            return None
+        vectors = np.load(os.path.join(self.root, tag, VECTORS_FILE))
+        self.loads += 1
+        logger.info(f"Loaded {len(vectors)} document embeddings from index version {tag}")
+        return vectors
+
+    def save_vectors(self, settings: Settings, fingerprint: str, vectors: np.ndarray):
+        tag = self.tag(settings, fingerprint)
+        path = os.path.join(self.root, tag)
+        os.makedirs(path, exist_ok=True)
+        self._write_atomic(os.path.join(path, VECTORS_FILE), lambda f: np.save(f, vectors), "wb")
+        meta = {
+            "format_version": VERSION_FORMAT,
+            "tag": tag,
+            "embeddings": embeddings_identity(settings),
+            "fingerprint": fingerprint,
+            "count": len(vectors),
+            "dimension": int(vectors.shape[1]) if len(vectors) else 0,
+            "created_at": time.time(),
+        }
+        self._write_atomic(os.path.join(path, VERSION_FILE), lambda f: json.dump(meta, f, indent=2))
+        self.saves += 1
+        logger.info(f"Saved index version {tag} ({len(vectors)} vectors)")
+
+    def activate(self, settings: Settings, fingerprint: str):
+        tag = self.tag(settings, fingerprint)
+        current = self.current()
+        if current and current["tag"] == tag:
+            return
+        manifest = {
+            "tag": tag,
+            "embeddings": embeddings_identity(settings),
+            "fingerprint": fingerprint,
+            "activated_at": time.time(),
+            "previous": current["tag"] if current else None,
+        }
+        self._write_atomic(os.path.join(self.root, MANIFEST_FILE), lambda f: json.dump(manifest, f, indent=2))
+        logger.info(f"Index version {tag} is now current" + (f" (was {manifest['previous']})" if manifest["previous"] else ""))
+        self.prune(manifest)
+
+    def versions(self) -> List[dict]:
+        found = []
+        for name in sorted(os.listdir(self.root)):
+            meta = self.version(name) if os.path.isdir(os.path.join(self.root, name)) else None
+            if meta:
+                found.append(meta)
+        return found
+
+    def prune(self, manifest: dict):
+        # Keeps the current version, the one it replaced (for a rollback) and the
+        # newest others up to keep_versions
+        keep = {manifest["tag"], manifest["previous"]}
+        others = sorted((meta for meta in self.versions() if meta["tag"] not in keep), key=lambda meta: meta["created_at"], reverse=True)
+        for meta in others[max(0, self.keep_versions - len(keep - {None})):]:
+            shutil.rmtree(os.path.join(self.root, meta["tag"]), ignore_errors=True)
+            logger.info(f"Removed old index version {meta['tag']}")
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "current": self.current(),
+            "versions": [meta["tag"] for meta in self.versions()],
+            "loads": self.loads,
+            "saves": self.saves,
+        }
+
+
+class DualReadComparator:
+    # Repeats a sample of live searches against a candidate retrieval service in the
+    # background and records how closely its results match what was served
+    def __init__(self, candidate, sample_rate: float = 0.1, max_samples: int = 50):
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.samples = 0
+        self.errors = 0
+        self.overlap_total = 0.0
+        self.top1_matches = 0
+        self.latencies: List[float] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def done(self) -> bool:
+        return self.samples >= self.max_samples
+
+    def observe(self, query: str, k: Optional[int], filters: Optional[dict], served: list):
+        if self.samples + len(self._tasks) >= self.max_samples or random.random() >= self.sample_rate:
+            return
+        task = asyncio.create_task(self._compare(query, k, filters, served))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compare(self, query: str, k: Optional[int], filters: Optional[dict], served: list):
+        start_time = time.monotonic()
+        try:
+            candidate = await self.candidate.asearch(query, k=k, filters=filters)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Dual-read search on the candidate index failed: {e}")
+            return
+        self.latencies.append((time.monotonic() - start_time) * 1000)
+        served_texts = [doc.page_content for doc in served]
+        candidate_texts = [doc.page_content for doc in candidate]
+        self.samples += 1
+        if served_texts:
+            self.overlap_total += len(set(served_texts) & set(candidate_texts)) / len(served_texts)
+        else:
+            self.overlap_total += 1.0 if not candidate_texts else 0.0
+        if served_texts[:1] == candidate_texts[:1]:
+            self.top1_matches += 1
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "samples": self.samples,
+            "target_samples": self.max_samples,
+            "errors": self.errors,
+            "avg_overlap": round(self.overlap_total / self.samples, 3) if self.samples else None,
+            "top1_agreement": round(self.top1_matches / self.samples, 3) if self.samples else None,
+            "candidate_p50_ms": round(float(np.percentile(self.latencies, 50)), 1) if self.latencies else None,
+        }
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+class ReindexRequest(BaseModel):
+    settings: dict = {}  # embeddings overrides, e.g. {"embeddings_provider": "local"}
+    dual_read_rate: Optional[float] = None  # None uses reindex_dual_read_rate
+    dual_read_samples: Optional[int] = None
+    cutover: Optional[str] = None  # auto | manual; None uses reindex_cutover
+
+
+class Reindexer:
+    # Background embeddings migration. The new embeddings and index are built next to
+    # the live ones, optionally compared against live traffic (dual read), then
+    # installed in one step through the lifecycle like any other swap; requests on
+    # the old version finish on the old index. Only one job runs at a time.
+    def __init__(self, components, lifecycle):
+        self.components = components
+        self.lifecycle = lifecycle
+        self.state = "idle"  # idle | building | comparing | ready | cut_over | failed | aborted
+        self.job: Optional[dict] = None
+        self.staged: Optional[dict] = None
+        self.comparator: Optional[DualReadComparator] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.state in ("building", "comparing", "ready")
+
+    def start(self, request: ReindexRequest) -> dict:
+        if self.running:
+            raise ValueError(f"A re-index is already {self.state}")
+        settings = self.components.settings
+        overrides = request.settings
+        unsupported = set(overrides) - set(Settings.model_fields)
+        if unsupported:
+            raise ValueError(f"Unknown settings: {sorted(unsupported)}")
+        cutover = request.cutover or settings.reindex_cutover
+        if cutover not in CUTOVER_MODES:
+            raise ValueError(f"Unknown cutover '{cutover}', expected one of {CUTOVER_MODES}")
+        target = Settings(**{**settings.model_dump(), **overrides})
+        self.job = {
+            "from": describe(embeddings_identity(settings)),
+            "to": describe(embeddings_identity(target)),
+            "overrides": overrides,
+            "cutover": cutover,
+            "started_at": time.time(),
+            "build_ms": None,
+            "error": None,
+        }
+        self.state = "building"
+        # Nothing from a previous job (its dual-read stats included) carries over
+        self.comparator = None
+        self.staged = None
+        rate = settings.reindex_dual_read_rate if request.dual_read_rate is None else request.dual_read_rate
+        samples = settings.reindex_dual_read_samples if request.dual_read_samples is None else request.dual_read_samples
+        self._task = asyncio.create_task(self._run(target, overrides, rate, samples, cutover))
+        logger.info(f"Re-indexing in the background: {self.job['from']} -> {self.job['to']}")
+        return self.stats()
+
+    async def _run(self, target: Settings, overrides: dict, rate: float, samples: int, cutover: str):
+        components = self.components
+        try:
+            start_time = time.monotonic()
+            self.staged = await components.stage("embeddings", target)
+            self.job["build_ms"] = round((time.monotonic() - start_time) * 1000, 1)
+            logger.info(f"Re-index to {self.job['to']} built in {self.job['build_ms']:.0f}ms")
+
+            if rate > 0 and samples > 0:
+                self.state = "comparing"
+                self.comparator = DualReadComparator(self.staged["retrieval_service"], rate, samples)
+                components.retrieval_service.dual_read = self.comparator
+                deadline = time.monotonic() + target.reindex_dual_read_timeout
+                while not self.comparator.done and time.monotonic() < deadline:
+                    await asyncio.sleep(0.5)
+                self._detach()
+                logger.info(f"Dual read finished: {self.comparator.stats()}")
+
+            self.state = "ready"
+            if cutover == "auto":
+                await self.cut_over()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Re-index to {self.job['to']} failed: {e}")
+            self.job["error"] = str(e)
+            self.state = "failed"
+            await self._discard()
+
+    def _detach(self):
+        service = self.components.retrieval_service
+        if self.comparator is not None and getattr(service, "dual_read", None) is self.comparator:
+            service.dual_read = None
+
+    async def _discard(self):
+        self._detach()
+        if self.comparator:
+            await self.comparator.close()
+        if self.staged:
+            await self.components.retire(self.staged)
+            self.staged = None
+
+    async def cut_over(self) -> dict:
+        if self.state == "comparing":
+            self._detach()
+        elif self.state != "ready":
+            raise ValueError(f"Nothing to cut over to (re-index is {self.state})")
+        components = self.components
+        async with components.swap_lock:
+            # Current settings (e.g. a model swapped meanwhile) plus the new embeddings
+            settings = Settings(**{**components.settings.model_dump(), **self.job["overrides"]})
+            swap = await self.lifecycle.install("embeddings", self.staged, settings, self.job["overrides"], self.job["build_ms"])
+        self.staged = None
+        self.state = "cut_over"
+        if self._task and self._task is not asyncio.current_task() and not self._task.done():
+            self._task.cancel()
+        if self.comparator:
+            await self.comparator.close()
+        logger.info(f"Cut over to {self.job['to']}")
+        return swap
+
+    async def abort(self) -> dict:
+        if not self.running:
+            raise ValueError(f"No re-index to abort (re-index is {self.state})")
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._discard()
+        self.state = "aborted"
+        logger.info(f"Aborted re-index to {self.job['to']}")
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "job": self.job,
+            "dual_read": self.comparator.stats() if self.comparator else None,
+        }
+
+    async def close(self):
+        if self.running:
+            await self.abort()
@@ -0,0 +1,32 @@
+import re
+from collections import Counter
+from typing import List
+
+WORD_PATTERN = re.compile(r"[a-z][a-z'-]+")
+
+# Function words plus the conversational filler that dominates chat turns
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are aren't as at be because been before being below
+between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down during each
+few for from further had hadn't has hasn't have haven't having he he'd he'll he's her here here's hers herself
+him himself his how how's i i'd i'll i'm i've if in into is isn't it it's its itself just let's like me more
+most mustn't my myself no nor not now of off on once only or other ought our ours ourselves out over own
+really same shan't she she'd she'll she's should shouldn't so some such than that that's the their theirs them
+themselves then there there's these they they'd they'll they're they've this those through to too under until
+up very was wasn't we we'd we'll we're we've were weren't what what's when when's where where's which while
+who who's whom why why's will with won't would wouldn't you you'd you'll you're you've your yours yourself
+yourselves
+feel feeling felt get got getting go going know want think thing things something lot maybe much many way
+well okay ok yes yeah hi hello hey thanks thank please sure right still even tell said say help try trying
+make makes made today now time day lately bit kind sort mean
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def extract_keywords(text: str, limit: int = 8) -> List[str]:
+    # Most frequent content words, ties broken by first appearance
+    counts = Counter(word for word in tokenize(text) if word not in STOPWORDS and len(word) > 2)
+    return [word for word, _ in counts.most_common(limit)]
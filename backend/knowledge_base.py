@@ -1,5 +1,10 @@
 from langchain_core.documents import Document
 
+try:
+    from .topics import document_metadata
+except ImportError:
+    from topics import document_metadata
+
 # This is where you can add detailed, valid information.
 # The more high-quality content you add here, the better the AI's responses will be.
 
@@ -500,5 +505,6 @@ knowledge = [
     
 ]
 
-# Transform the list of dictionaries into a list of Document objects
-documents = [Document(page_content=item["content"], metadata={"source": item["source"]}) for item in knowledge]
\ No newline at end of file
+# Transform the list of dictionaries into a list of Document objects. Entries may
+# declare a "topic"; otherwise it is inferred from the source title and content.
+documents = [Document(page_content=item["content"], metadata=document_metadata(item)) for item in knowledge]
\ No newline at end of file
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+
+from pydantic import BaseModel
+
+try:
+    from .components import Components
+    from .config import Settings
+except ImportError:
+    from components import Components
+    from config import Settings
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+
+
+class DrainRequest(BaseModel):
+    timeout: Optional[float] = None  # seconds in-flight requests get to finish; None uses drain_timeout
+    wait: bool = False  # respond only once the drain has finished
+
+
+class SwapRequest(BaseModel):
+    component: str  # llm | embeddings | retriever
+    settings: dict = {}  # Settings overrides for the replacement, e.g. {"llm_model": "..."}
+
+
+class Lifecycle:
+    # Admission control, graceful drain and hot-swap for one worker.
+    #
+    # Every admitted request is counted against the components version it started on
+    # until its (possibly streamed) body is fully sent. drain() stops admitting, waits
+    # up to a deadline for in-flight requests, then flushes history and caches; it
+    # runs on SIGTERM before the server's own shutdown, or via /admin/drain.
+    #
+    # swap() builds a replacement LLM, embeddings + index, or retrieval service next
+    # to the live one, installs it in one step (bumping the version), and retires the
+    # old objects only once every request admitted on an older version has finished.
+    def __init__(self, components: Components, drain_timeout: float = 30.0):
+        self.components = components
+        self.drain_timeout = drain_timeout
+        self.state = "running"  # running | draining | drained
+        self.in_flight: Dict[int, int] = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.swaps = 0
+        self.last_drain: Optional[dict] = None
+        self.last_swap: Optional[dict] = None
+        self._drain_task: Optional[asyncio.Task] = None
+        self._retire_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def admitting(self) -> bool:
+        return self.state == "running"
+
+    def enter(self) -> int:
+        version = self.components.version
+        self.in_flight[version] = self.in_flight.get(version, 0) + 1
+        self.admitted += 1
+        return version
+
+    def exit(self, version: int):
+        remaining = self.in_flight.get(version, 0) - 1
+        if remaining > 0:
+            self.in_flight[version] = remaining
+        else:
+            self.in_flight.pop(version, None)
+
+    async def track(self, body: AsyncIterator, version: int) -> AsyncIterator:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.exit(version)
+
+    def reject(self):
+        self.rejected += 1
+
+    async def wait_until_idle(self, deadline: float, up_to_version: Optional[int] = None) -> bool:
+        # True once no request started on a version <= up_to_version (any, if None) is running
+        while time.monotonic() < deadline:
+            if not any(up_to_version is None or version <= up_to_version for version in self.in_flight):
+                return True
+            await asyncio.sleep(POLL_INTERVAL)
+        return False
+
+    def start_drain(self, timeout: Optional[float] = None) -> asyncio.Task:
+        if self._drain_task is None:
+            # Admission stops now, not when the task first runs
+            self.state = "draining"
+            self._drain_task = asyncio.create_task(self._drain(self.drain_timeout if timeout is None else timeout))
+        return self._drain_task
+
+    async def drain(self, timeout: Optional[float] = None) -> dict:
+        return await asyncio.shield(self.start_drain(timeout))
+
+    async def _drain(self, timeout: float) -> dict:
+        start_time = time.monotonic()
+        in_flight = sum(self.in_flight.values())
+        logger.info(f"Draining: no longer admitting requests, waiting up to {timeout:.0f}s for {in_flight} in flight")
+        idle = await self.wait_until_idle(start_time + timeout)
+        abandoned = sum(self.in_flight.values())
+        if not idle:
+            logger.warning(f"Drain deadline reached with {abandoned} requests still in flight")
+        try:
+            await self.components.flush()
+        except Exception as e:
+            logger.error(f"Error flushing during drain: {e}")
+        self.state = "drained"
+        self.last_drain = {
+            "in_flight_at_start": in_flight,
+            "abandoned": abandoned,
+            "duration_ms": round((time.monotonic() - start_time) * 1000, 1),
+        }
+        logger.info(f"Drain complete: {self.last_drain}")
+        return self.last_drain
+
+    def resume(self):
+        if self._drain_task and not self._drain_task.done():
+            self._drain_task.cancel()
+        self._drain_task = None
+        self.state = "running"
+        logger.info("Resumed admitting requests")
+
+    def install_signal_handlers(self):
+        # SIGTERM drains first, then hands over to whatever handler was installed
+        # before (the server's own graceful shutdown)
+        try:
+            loop = asyncio.get_running_loop()
+            previous = signal.getsignal(signal.SIGTERM)
+            loop.add_signal_handler(signal.SIGTERM, self._on_sigterm, previous)
+        except (NotImplementedError, RuntimeError, ValueError) as e:
+            logger.warning(f"Cannot install SIGTERM drain handler: {e}")
+
+    def _on_sigterm(self, previous: Callable):
+        if self._drain_task is not None and not self._drain_task.done():
+            # Second SIGTERM while draining: stop waiting
+            self._hand_over(previous)
+            return
+        logger.info("SIGTERM received, draining before shutdown")
+        self.start_drain().add_done_callback(lambda _: self._hand_over(previous))
+
+    def _hand_over(self, previous):
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGTERM)
+        if callable(previous):
+            previous(signal.SIGTERM, None)
+        else:
+            signal.signal(signal.SIGTERM, previous if previous is not None else signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    async def swap(self, component: str, overrides: dict) -> dict:
+        components = self.components
+        # Validated like any other settings; unknown fields are rejected
+        unknown = set(overrides) - set(Settings.model_fields)
+        if unknown:
+            raise ValueError(f"Unknown settings: {sorted(unknown)}")
+        settings = Settings(**{**components.settings.model_dump(), **overrides})
+
+        async with components.swap_lock:
+            start_time = time.monotonic()
+            staged = await components.stage(component, settings)
+            build_ms = round((time.monotonic() - start_time) * 1000, 1)
+            return await self.install(component, staged, settings, overrides, build_ms)
+
+    async def install(self, component: str, staged: dict, settings: Settings, overrides: dict, build_ms: float) -> dict:
+        # Callers hold components.swap_lock
+        components = self.components
+        old_version, replaced = components.install(staged, settings)
+        self.swaps += 1
+        self.last_swap = {
+            "component": component,
+            "overrides": overrides,
+            "version": components.version,
+            "replaced_version": old_version,
+            "build_ms": build_ms,
+            "timestamp": time.time(),
+        }
+        logger.info(f"Swapped {component} (version {old_version} -> {components.version}, built in {build_ms:.0f}ms)")
+        if "embeddings" in staged:
+            try:
+                await components.activate_index(settings)
+            except Exception as e:
+                logger.error(f"Failed to record the {settings.embeddings_provider} index version as current: {e}")
+        task = asyncio.create_task(self._retire(old_version, replaced))
+        self._retire_tasks.add(task)
+        task.add_done_callback(self._retire_tasks.discard)
+        return self.last_swap
+
+    async def _retire(self, old_version: int, replaced: dict):
+        if not await self.wait_until_idle(time.monotonic() + self.drain_timeout, old_version):
+            logger.warning(f"Retiring version {old_version} components with requests still in flight")
+        try:
+            await self.components.retire(replaced)
+        except Exception as e:
+            logger.error(f"Error retiring replaced components: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "version": self.components.version,
+            "in_flight": sum(self.in_flight.values()),
+            "in_flight_by_version": dict(sorted(self.in_flight.items())),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "swaps": self.swaps,
+            "retiring": len(self._retire_tasks),
+            "last_drain": self.last_drain,
+            "last_swap": self.last_swap,
+        }
+
+    async def close(self):
+        if self._retire_tasks:
+            await asyncio.gather(*list(self._retire_tasks), return_exceptions=True)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"  # baked into the Docker image by download_models.py
+
+
+class LocalEmbeddings(Embeddings):
+    # In-process SentenceTransformer embeddings. All encoding goes through one
+    # background worker thread that merges concurrent requests into micro-batches,
+    # so N simultaneous queries cost one forward pass instead of N.
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        num_threads: Optional[int] = None,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        backend: str = "torch",
+        onnx_file_name: Optional[str] = None,
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Local embeddings require the sentence-transformers package") from e
+
+        if num_threads:
+            # Keep intra-op parallelism from oversubscribing the box alongside uvicorn workers
+            import torch
+            torch.set_num_threads(num_threads)
+
+        model_kwargs = {}
+        if backend == "onnx":
+            # e.g. onnx_file_name="onnx/model_qint8_avx2.onnx" for the int8-quantized export
+            if onnx_file_name:
+                model_kwargs["file_name"] = onnx_file_name
+            if num_threads:
+                import onnxruntime
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = num_threads
+                model_kwargs["session_options"] = session_options
+
+        self.model_name = model_name
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.model = SentenceTransformer(model_name, device="cpu", backend=backend, model_kwargs=model_kwargs or None)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+        self.total_batches = 0
+        self.total_texts = 0
+        self.max_observed_batch = 0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="local-embeddings", daemon=True)
+        self._worker.start()
+        logger.info(f"Local embeddings ready: {model_name} ({backend}, dimension {self.dimension})")
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            # Futures cancelled while queued (caller timed out) are skipped, not encoded
+            jobs = [job] if job[1].set_running_or_notify_cancel() else []
+            size = len(job[0]) if jobs else 0
+            stop_after_batch = False
+            deadline = time.monotonic() + self.max_wait
+            # Collect more jobs until the batch is full or the wait window closes
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    next_job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if next_job is None:
+                    stop_after_batch = True
+                    break
+                if next_job[1].set_running_or_notify_cancel():
+                    jobs.append(next_job)
+                    size += len(next_job[0])
+
+            if jobs:
+                self._encode(jobs)
+            if stop_after_batch:
+                return
+
+    def _encode(self, jobs: List[tuple]):
+        texts = [text for job_texts, _ in jobs for text in job_texts]
+        try:
+            vectors = self.model.encode(texts, batch_size=self.max_batch_size, normalize_embeddings=True, convert_to_numpy=True)
+        except Exception as e:
+            results = [(future, None, e) for _, future in jobs]
+        else:
+            results = []
+            offset = 0
+            for job_texts, future in jobs:
+                results.append((future, vectors[offset:offset + len(job_texts)].tolist(), None))
+                offset += len(job_texts)
+            self.total_batches += 1
+            self.total_texts += len(texts)
+            self.max_observed_batch = max(self.max_observed_batch, len(texts))
+
+        for future, result, error in results:
+            # One unusable future must not take down the only encode thread
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            except Exception as e:
+                logger.warning(f"Dropping local embeddings result: {e}")
+
+    def _submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        if self._stopped:
+            future.set_exception(RuntimeError("Local embeddings worker is stopped"))
+            return future
+        self._queue.put((list(texts), future))
+        return future
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(texts).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Waits on the worker's future without tying up an executor thread
+        return await asyncio.wrap_future(self._submit(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await asyncio.wrap_future(self._submit([text])))[0]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "dimension": self.dimension,
+            "total_batches": self.total_batches,
+            "total_texts": self.total_texts,
+            "avg_batch_size": round(self.total_texts / self.total_batches, 2) if self.total_batches else None,
+            "max_batch_size_seen": self.max_observed_batch,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def close(self):
+        self._stopped = True
+        self._queue.put(None)
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    from .vector_index import FILTER_OVERFETCH, EmbeddingMatrixIndex, Filters, allowed_values, filter_results, top_k
+except ImportError:
+    from vector_index import FILTER_OVERFETCH, EmbeddingMatrixIndex, Filters, allowed_values, filter_results, top_k
+
+logger = logging.getLogger(__name__)
+
+UNPARTITIONED = "_none"
+
+
+def partition_dir_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+class PartitionedIndex:
+    # One EmbeddingMatrixIndex per value of a metadata field (e.g. topic). A filter on
+    # that field prunes to the matching partitions before any vector is scanned, so a
+    # filtered search costs the size of those partitions, not the corpus. Filters on
+    # other fields are applied to an over-fetched result list afterwards. Unfiltered
+    # searches scan every partition and merge the per-partition top-k.
+    score_kind = "cosine"
+
+    def __init__(self, partitions: Dict[str, EmbeddingMatrixIndex], partition_by: str):
+        self.partitions = partitions
+        self.partition_by = partition_by
+        self.rows_scanned = 0
+        self.searches = 0
+        self.partitions_searched = 0
+
+    @classmethod
+    def from_faiss(cls, vector_store, partition_by: str = "topic", **kwargs) -> "PartitionedIndex":
+        count = vector_store.index.ntotal
+        vectors = vector_store.index.reconstruct_n(0, count)
+        documents = [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(count)]
+
+        rows_by_partition: Dict[str, List[int]] = {}
+        for row, doc in enumerate(documents):
+            rows_by_partition.setdefault(str(doc.metadata.get(partition_by, UNPARTITIONED)), []).append(row)
+
+        partitions = {}
+        for name, rows in rows_by_partition.items():
+            partitions[name] = EmbeddingMatrixIndex(
+                vectors[rows],
+                [documents[row].page_content for row in rows],
+                [documents[row].metadata for row in rows],
+                ids=rows,
+                **kwargs
+            )
+        logger.info(f"Built {len(partitions)} '{partition_by}' partitions: " + ", ".join(f"{name}={len(index)}" for name, index in sorted(partitions.items())))
+        return cls(partitions, partition_by)
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self.partitions.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(index.nbytes for index in self.partitions.values())
+
+    @property
+    def quantization(self) -> str:
+        return next(iter(self.partitions.values())).quantization
+
+    @property
+    def dtype(self) -> str:
+        return next(iter(self.partitions.values())).dtype
+
+    def select_partitions(self, filters: Optional[Filters]) -> List[str]:
+        if filters and self.partition_by in filters:
+            wanted = allowed_values(filters[self.partition_by])
+            return [name for name in self.partitions if name in wanted]
+        return list(self.partitions)
+
+    def search_with_scores(self, query_matrix: np.ndarray, k: int, filters: Optional[Filters] = None) -> List[List[Tuple[Document, float]]]:
+        query_matrix = np.atleast_2d(query_matrix)
+        names = self.select_partitions(filters)
+        residual_filters = {field: value for field, value in (filters or {}).items() if field != self.partition_by}
+        fetch_k = k * FILTER_OVERFETCH if residual_filters else k
+
+        self.searches += 1
+        self.partitions_searched += len(names)
+        if not names:
+            return [[] for _ in range(len(query_matrix))]
+
+        # Per-partition top-k, then one merge over the stacked candidates
+        all_scores, all_rows, column_partitions = [], [], []
+        for name in names:
+            index = self.partitions[name]
+            self.rows_scanned += len(index) * len(query_matrix)
+            scores, rows = index.search(query_matrix, min(fetch_k, len(index)))
+            all_scores.append(scores)
+            all_rows.append(rows)
+            column_partitions.extend([name] * scores.shape[1])
+        merged_scores = np.hstack(all_scores)
+        merged_rows = np.hstack(all_rows)
+        best_scores, best_columns = top_k(merged_scores, min(fetch_k, merged_scores.shape[1]))
+
+        results = []
+        for query_index, (row_scores, row_columns) in enumerate(zip(best_scores, best_columns)):
+            results.append([
+                (self.partitions[column_partitions[column]].document(int(merged_rows[query_index, column])), float(score))
+                for score, column in zip(row_scores, row_columns)
+            ])
+        return filter_results(results, residual_filters, k) if residual_filters else results
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        names = {}
+        for name, index in self.partitions.items():
+            names[name] = partition_dir_name(name)
+            index.save(os.path.join(path, names[name]))
+        # Written last, like meta.json for a single index
+        with open(os.path.join(path, "partitions.json"), "w") as f:
+            json.dump({"partition_by": self.partition_by, "partitions": names}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "PartitionedIndex":
+        with open(os.path.join(path, "partitions.json")) as f:
+            meta = json.load(f)
+        partitions = {
+            name: EmbeddingMatrixIndex.load(os.path.join(path, directory), mmap=mmap)
+            for name, directory in meta["partitions"].items()
+        }
+        return cls(partitions, meta["partition_by"])
+
+    def stats(self) -> dict:
+        return {
+            "partition_by": self.partition_by,
+            "partitions": {name: len(index) for name, index in sorted(self.partitions.items())},
+            "searches": self.searches,
+            "avg_partitions_searched": round(self.partitions_searched / self.searches, 2) if self.searches else None,
+            "avg_rows_scanned": round(self.rows_scanned / self.searches, 1) if self.searches else None,
+        }
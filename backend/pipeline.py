@@ -0,0 +1,496 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+try:
+    from .components import Components, response_text
+    from .resilience import CircuitOpenError
+    from .usage import response_usage
+    from .topics import infer_query_topics
+    from .user_memory import format_memories
+    from .brownout import NORMAL_PLAN, BrownoutPlan
+    from .traffic import note
+except ImportError:
+    from components import Components, response_text
+    from resilience import CircuitOpenError
+    from usage import response_usage
+    from topics import infer_query_topics
+    from user_memory import format_memories
+    from brownout import NORMAL_PLAN, BrownoutPlan
+    from traffic import note
+
+logger = logging.getLogger(__name__)
+
+GREETING_PATTERN = re.compile(r'^\s*(hi|hello|hey|heya|yo|whatsup|wassup|good\s+(morning|afternoon|evening)|greetings)\s*[!.]*\s*$', re.IGNORECASE)
+EMPTY_MESSAGE_RESPONSE = "I'd love to hear what's on your mind. Please share something with me so I can help you better."
+GREETING_RESPONSE = "Hello! I'm here to provide you with evidence-based therapeutic support. How are you feeling today, and what would you like to work on together?"
+FALLBACK_RESPONSE = "I understand you're reaching out for support. Could you tell me more about what you're experiencing right now? I'm here to help you with evidence-based therapeutic techniques."
+LLM_UNAVAILABLE_RESPONSE = "I'm here with you, but I'm having trouble putting my thoughts together right now. Please give me a minute and try again. If you're in crisis, please reach out to a local emergency line or someone you trust."
+BROWNOUT_RESPONSE = "I'm here with you, and I want to give you my full attention, but a lot of people are reaching out right now. Please give me a moment and send that again. If you're in crisis, please reach out to a local emergency line or someone you trust."
+LLM_ERROR_RESPONSE = "I'm having trouble processing your message right now, but I'm here to help. Could you try rephrasing what you'd like to work on therapeutically?"
+FAST_PATH_RESPONSES = {"empty": EMPTY_MESSAGE_RESPONSE, "greeting": GREETING_RESPONSE}
+SOURCES_SEPARATOR = "\n\n---SOURCES---\n\n"
+MAX_BATCH_ITEMS = 5000  # hard ceiling; settings.max_batch_items can only lower it
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def elapsed_ms(since: float) -> float:
+    return round((time.monotonic() - since) * 1000, 1)
+
+
+class ChatRequest(BaseModel):
+    message: str
+    user_id: Optional[str] = None
+    filters: Optional[Dict[str, List[str]]] = None  # metadata filters, e.g. {"topic": ["sleep"]}
+
+
+class JournalRequest(BaseModel):
+    user_id: str
+    text: str
+
+
+class BatchChatItem(BaseModel):
+    message: str
+    id: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(max_length=MAX_BATCH_ITEMS)
+    max_concurrency: int = 8
+    filters: Optional[Dict[str, List[str]]] = None
+
+
+class ChatPipeline:
+    def __init__(self, components: Components):
+        self.components = components
+
+    @property
+    def settings(self):
+        # Follows hot-swaps, which install new settings along with new components
+        return self.components.settings
+
+    def fast_path_kind(self, message: str) -> Optional[str]:
+        if not self.settings.fast_paths:
+            return None
+        if not message or not message.strip():
+            return "empty"
+        if GREETING_PATTERN.match(message):
+            return "greeting"
+        return None
+
+    def fast_path_response(self, message: str) -> Optional[str]:
+        return FAST_PATH_RESPONSES.get(self.fast_path_kind(message))
+
+    def not_ready_response(self) -> Optional[str]:
+        components = self.components
+        if not components.initialization_complete:
+            if components.initialization_error:
+                return f"I'm sorry, there was an error starting up the system: {components.initialization_error}. Please contact support."
+            return "I'm sorry, the system is still starting up. Please try again in a moment."
+        if not components.ready:
+            return "I'm sorry, some components are not properly initialized. Please try again later."
+        return None
+
+    def previous_messages(self, request: ChatRequest) -> List[dict]:
+        # Only identified users: anonymous requests share one history bucket
+        if not self.components.condenser or not request.user_id:
+            return []
+        return self.components.history.recent_messages(request.user_id, 2 * self.settings.condense_history_turns)
+
+    def route_filters(self, query: str, filters: Optional[Dict[str, List[str]]]) -> Optional[Dict[str, List[str]]]:
+        # partition_routing=auto narrows unfiltered searches to the topics the query names
+        if filters or self.settings.partition_routing != "auto":
+            return filters
+        topics = infer_query_topics(query)
+        return {"topic": topics} if topics else None
+
+    def brownout_plan(self) -> BrownoutPlan:
+        brownout = self.components.brownout
+        return brownout.plan() if brownout else NORMAL_PLAN
+
+    def llm_for(self, plan: BrownoutPlan):
+        components = self.components
+        if plan.level == 0:
+            return components.llm
+        return components.brownout.llm_for(plan, components.llm, components.brownout_llm, self.settings.llm_provider)
+
+    async def conversation_state(self, request: ChatRequest, user_id: str, plan: BrownoutPlan) -> Tuple[str, List[dict], Optional[List[dict]]]:
+        # Recent history, the turns the condenser sees and the prompt window (None when
+        # brownout has turned history off, which also skips memory recall)
+        if not plan.use_history:
+            return "", [], None
+        history = self.components.history
+        conversation_context = await history.aget_context(user_id)
+        return conversation_context, self.previous_messages(request), history.recent_messages(user_id, self.settings.history_window)
+
+    async def retrieve(
+        self,
+        message: str,
+        user_id: Optional[str] = None,
+        previous_messages: Optional[List[dict]] = None,
+        filters: Optional[Dict[str, List[str]]] = None,
+        k: Optional[int] = None,
+        shape: Optional[dict] = None,
+        message_vector: Optional[asyncio.Task] = None
+    ) -> Tuple[list, str]:
+        # Returns the documents and the query actually searched. Skipped straight away
+        # if the embeddings circuit is open. shape collects what hit for traffic capture;
+        # message_vector is the message's embedding when memory recall computes it anyway.
+        components = self.components
+        if components.prefetcher and user_id and not filters:
+            prefetched_docs = components.prefetcher.lookup(user_id, message)
+            note(shape, prefetch_hit=prefetched_docs is not None)
+            if prefetched_docs is not None:
+                logger.info(f"Using {len(prefetched_docs)} prefetched documents")
+                return prefetched_docs[:k] if k else prefetched_docs, message
+        query = message
+        if components.condenser and previous_messages:
+            query = await components.condenser.condense(message, previous_messages)
+        filters = self.route_filters(query, filters)
+        query_cache = getattr(components.retrieval_service, "query_cache", None)
+        note(shape, condensed=query != message, query_cache_hit=query_cache is not None and query in query_cache.vectors)
+        try:
+            vector = await message_vector if message_vector is not None and query == message else None
+            retrieved_docs = await components.retrieval_service.asearch(query, k=k, filters=filters, vector=vector)
+            logger.info(f"Retrieved {len(retrieved_docs)} documents" + (f" (filters: {filters})" if filters else ""))
+            return retrieved_docs, query
+        except CircuitOpenError:
+            logger.warning("Embeddings circuit open, generating without retrieved context")
+        except asyncio.TimeoutError:
+            logger.error(f"Retrieval timed out after {components.embeddings_breaker.current_timeout():.1f}s")
+        except Exception as e:
+            logger.error(f"Error retrieving documents: {e}")
+        return [], query
+
+    def embed_for_recall(self, request: ChatRequest, window_messages: Optional[List[dict]]) -> Optional[asyncio.Task]:
+        # The message's embedding when memory recall will run, started once and shared
+        # with retrieval (which reuses it unless the query was condensed or prefetched)
+        memory = self.components.user_memory
+        if not memory or window_messages is None or not request.user_id or not request.message.strip():
+            return None
+        return asyncio.ensure_future(self.components.retrieval_service.aembed_query(request.message))
+
+    async def recall_memories(self, request: ChatRequest, window_messages: Optional[List[dict]], message_vector: Optional[asyncio.Task]) -> str:
+        # Long-term recall for identified users, rendered ahead of the recent history.
+        # The message's vector is then stored, so it never recalls itself.
+        memory = self.components.user_memory
+        if message_vector is None:
+            return ""
+        try:
+            vector = await message_vector
+            recalled = await memory.recall(request.user_id, vector, exclude={msg["message"] for msg in window_messages})
+            memory.remember_later(request.user_id, request.message, vector=vector)
+        except CircuitOpenError:
+            return ""
+        except Exception as e:
+            logger.error(f"Error recalling user memories: {e}")
+            return ""
+        if recalled:
+            logger.info(f"Recalled {len(recalled)} memories")
+        return format_memories(recalled)
+
+    async def remember_journal(self, request: JournalRequest):
+        await self.components.user_memory.remember(request.user_id, request.text, "journal")
+
+    def build_messages(self, message: str, conversation_context: str, retrieved_docs: list) -> list:
+        context_text = "\n\n".join([doc.page_content for doc in retrieved_docs]) if retrieved_docs else ""
+        return self.components.prompt_template.format_messages(
+            input=message,
+            context=context_text,
+            conversation_history=conversation_context
+        )
+
+    async def generate_response(self, message: str, conversation_context: str, retrieved_docs: list, llm=None) -> str:
+        components = self.components
+        formatted_prompt = self.build_messages(message, conversation_context, retrieved_docs)
+
+        response_obj = await components.llm_breaker.call((llm or components.llm).ainvoke, formatted_prompt)
+        components.llm_usage.record(response_usage(response_obj))
+        full_response = response_text(response_obj)
+
+        if not full_response or not full_response.strip():
+            full_response = FALLBACK_RESPONSE
+        return full_response
+
+    async def stream(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+        components = self.components
+        admitted_at = None
+        shape = components.traffic.begin(request, "stream") if components.traffic else None
+        started_at = time.monotonic()
+        try:
+            if request.user_id:
+                logger.info(f"Processing message from user: {request.user_id}")
+            else:
+                logger.info("Processing message from anonymous user")
+
+            fast_path = self.fast_path_kind(request.message)
+            if fast_path:
+                note(shape, fast_path=fast_path)
+                yield FAST_PATH_RESPONSES[fast_path]
+                return
+
+            not_ready = self.not_ready_response()
+            if not_ready:
+                note(shape, fast_path="not_ready")
+                yield not_ready
+                return
+
+            plan = self.brownout_plan()
+            note(shape, brownout=plan.name)
+            if plan.canned:
+                note(shape, fast_path="brownout")
+                yield BROWNOUT_RESPONSE
+                return
+            if components.brownout:
+                admitted_at = components.brownout.enter()
+
+            # Get conversation context
+            user_id = request.user_id or "anonymous"
+            conversation_context, previous_messages, window_messages = await self.conversation_state(request, user_id, plan)
+            note(shape, history_messages=len(window_messages) if window_messages is not None else None)
+            await components.history.aadd(user_id, request.message, True)
+
+            logger.info(f"Processing message: {request.message[:100]}...")
+
+            # RAG: Retrieve relevant documents and recall the user's own past messages,
+            # embedding the message once for both
+            message_vector = self.embed_for_recall(request, window_messages)
+            (retrieved_docs, retrieval_query), memories = await asyncio.gather(
+                self.retrieve(request.message, request.user_id, previous_messages, request.filters, plan.k, shape, message_vector),
+                self.recall_memories(request, window_messages, message_vector)
+            )
+            conversation_context = memories + conversation_context
+            note(shape, retrieved=len(retrieved_docs), memories=bool(memories))
+
+            # Generate response with RAG context
+            generation_start = time.monotonic()
+            try:
+                full_response = await self.generate_response(request.message, conversation_context, retrieved_docs, self.llm_for(plan))
+                logger.info(f"Generated response: {full_response[:100]}...")
+                await components.history.aadd(user_id, full_response, False)
+                if components.condenser:
+                    components.condenser.record_response(retrieval_query != request.message, full_response)
+                # Prefetch for the likely follow-up while this answer streams out
+                if components.prefetcher and request.user_id:
+                    components.prefetcher.schedule(request.user_id, request.message, full_response)
+            except CircuitOpenError:
+                logger.warning("LLM circuit open, returning canned response")
+                full_response = LLM_UNAVAILABLE_RESPONSE
+                note(shape, fallback="llm_unavailable")
+            except asyncio.TimeoutError:
+                logger.error(f"LLM call timed out after {components.llm_breaker.current_timeout():.1f}s")
+                full_response = LLM_ERROR_RESPONSE
+                note(shape, fallback="llm_timeout")
+            except Exception as e:
+                logger.error(f"Error generating response: {e}")
+                full_response = LLM_ERROR_RESPONSE
+                note(shape, fallback="generation_failed")
+            note(shape, generation_ms=elapsed_ms(generation_start), response_chars=len(full_response))
+
+            if self.settings.stream_mode == "words":
+                words = full_response.split(' ')
+                for i, word in enumerate(words):
+                    if i > 0:
+                        yield ' '
+                    yield word
+                    await asyncio.sleep(self.settings.stream_word_delay)
+            else:
+                yield full_response
+
+            if self.settings.include_sources:
+                sources = [doc.metadata for doc in retrieved_docs]
+                yield SOURCES_SEPARATOR + json.dumps(sources)
+
+        except Exception as e:
+            logger.error(f"Critical error in stream_generator: {e}")
+            yield "I'm sorry, I encountered an unexpected error. Please try again, and if the problem persists, please contact support."
+            note(shape, fallback="internal_error")
+        finally:
+            if admitted_at is not None:
+                components.brownout.exit(admitted_at)
+            if shape is not None:
+                components.traffic.finish(shape, started_at)
+
+    # Server-Sent Events protocol: retrieval results go out before generation starts,
+    # then real token deltas from the LLM stream, timings and a final done event.
+    #   event: retrieval  data: {"sources": [...], "count": n, "query": "..."}
+    #   event: delta      data: {"text": "..."}
+    #   event: error      data: {"error": "..."}  (generation failed after partial output)
+    #   event: timing     data: {"retrieval_ms", "ttft_ms", "generation_ms", "total_ms"}
+    #   event: done       data: {"usage": {...} | null, "fallback": null | "...", "response_chars": n, "brownout": level name}
+    async def events(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+        components = self.components
+        start_time = time.monotonic()
+        timings = {"retrieval_ms": None, "ttft_ms": None, "generation_ms": None}
+        admitted_at = None
+        shape = components.traffic.begin(request, "events") if components.traffic else None
+        plan = NORMAL_PLAN
+        try:
+            fast_path = self.fast_path_kind(request.message)
+            canned_response = FAST_PATH_RESPONSES.get(fast_path) or self.not_ready_response()
+            if canned_response and not fast_path:
+                fast_path = "not_ready"
+            if not canned_response:
+                plan = self.brownout_plan()
+                if plan.canned:
+                    canned_response = BROWNOUT_RESPONSE
+                    fast_path = "brownout"
+            note(shape, fast_path=fast_path, brownout=plan.name)
+            if canned_response:
+                yield sse_event("delta", {"text": canned_response})
+                yield sse_event("timing", {**timings, "total_ms": elapsed_ms(start_time)})
+                yield sse_event("done", {"usage": None, "fallback": "canned", "response_chars": len(canned_response), "brownout": plan.name})
+                return
+            if components.brownout:
+                admitted_at = components.brownout.enter()
+
+            user_id = request.user_id or "anonymous"
+            conversation_context, previous_messages, window_messages = await self.conversation_state(request, user_id, plan)
+            note(shape, history_messages=len(window_messages) if window_messages is not None else None)
+            await components.history.aadd(user_id, request.message, True)
+
+            retrieval_start = time.monotonic()
+            message_vector = self.embed_for_recall(request, window_messages)
+            (retrieved_docs, retrieval_query), memories = await asyncio.gather(
+                self.retrieve(request.message, request.user_id, previous_messages, request.filters, plan.k, shape, message_vector),
+                self.recall_memories(request, window_messages, message_vector)
+            )
+            conversation_context = memories + conversation_context
+            timings["retrieval_ms"] = elapsed_ms(retrieval_start)
+            note(shape, retrieved=len(retrieved_docs), memories=bool(memories))
+            yield sse_event("retrieval", {"sources": [doc.metadata for doc in retrieved_docs], "count": len(retrieved_docs), "query": retrieval_query})
+
+            formatted_prompt = self.build_messages(request.message, conversation_context, retrieved_docs)
+            generation_start = time.monotonic()
+            parts = []
+            aggregate = None
+            fallback = None
+            try:
+                async for chunk in components.llm_breaker.stream(self.llm_for(plan).astream, formatted_prompt):
+                    # Chat model chunks add up to a message carrying usage; LLM chunks are str
+                    aggregate = chunk if aggregate is None else aggregate + chunk
+                    text = response_text(chunk)
+                    if not text:
+                        continue
+                    if timings["ttft_ms"] is None:
+                        timings["ttft_ms"] = elapsed_ms(generation_start)
+                    parts.append(text)
+                    yield sse_event("delta", {"text": text})
+            except CircuitOpenError:
+                logger.warning("LLM circuit open, returning canned response")
+                fallback = "llm_unavailable"
+            except asyncio.TimeoutError:
+                logger.error(f"LLM stream timed out after {components.llm_breaker.current_timeout():.1f}s")
+                fallback = "llm_timeout"
+            except Exception as e:
+                logger.error(f"Error streaming response: {e}")
+                fallback = "generation_failed"
+            timings["generation_ms"] = elapsed_ms(generation_start)
+
+            full_response = "".join(parts)
+            if fallback and parts:
+                yield sse_event("error", {"error": fallback})
+            elif fallback or not full_response.strip():
+                full_response = LLM_UNAVAILABLE_RESPONSE if fallback == "llm_unavailable" else LLM_ERROR_RESPONSE if fallback else FALLBACK_RESPONSE
+                yield sse_event("delta", {"text": full_response})
+            if not fallback:
+                await components.history.aadd(user_id, full_response, False)
+                if components.condenser:
+                    components.condenser.record_response(retrieval_query != request.message, full_response)
+                if components.prefetcher and request.user_id:
+                    components.prefetcher.schedule(request.user_id, request.message, full_response)
+
+            usage = response_usage(aggregate) if aggregate is not None else None
+            components.llm_usage.record(usage)
+            note(shape, fallback=fallback, response_chars=len(full_response), **timings)
+            yield sse_event("timing", {**timings, "total_ms": elapsed_ms(start_time)})
+            yield sse_event("done", {"usage": usage, "fallback": fallback, "response_chars": len(full_response), "brownout": plan.name})
+
+        except Exception as e:
+            logger.error(f"Critical error in event stream: {e}")
+            yield sse_event("error", {"error": "internal_error"})
+            yield sse_event("done", {"usage": None, "fallback": "internal_error", "response_chars": 0, "brownout": plan.name})
+            note(shape, fallback="internal_error")
+        finally:
+            if admitted_at is not None:
+                components.brownout.exit(admitted_at)
+            if shape is not None:
+                components.traffic.finish(shape, start_time)
+
+    # Batch API for bulk/offline replay. Items are processed statelessly: they neither
+    # read nor write conversation history.
+    async def generate_batch_item(self, index: int, message: str, docs: list, plan: BrownoutPlan) -> dict:
+        components = self.components
+        docs = docs[:plan.k] if plan.k else docs
+        admitted_at = components.brownout.enter() if components.brownout else None
+        try:
+            response = await self.generate_response(message, "", docs, self.llm_for(plan))
+            return {"response": response, "sources": [doc.metadata for doc in docs]}
+        except CircuitOpenError:
+            return {"error": "llm_unavailable"}
+        except asyncio.TimeoutError:
+            return {"error": "llm_timeout"}
+        except Exception as e:
+            logger.error(f"Error generating batch item {index}: {e}")
+            return {"error": "generation_failed"}
+        finally:
+            if admitted_at is not None:
+                components.brownout.exit(admitted_at)
+
+    async def batch(self, request: BatchChatRequest) -> AsyncGenerator[str, None]:
+        components = self.components
+        items = request.items
+        retrieved = [[] for _ in items]
+
+        # Embed and search every non-canned query in one go, at the current brownout level
+        plan = self.brownout_plan()
+        pending = [] if plan.canned else [i for i, item in enumerate(items) if self.fast_path_response(item.message) is None]
+        if pending:
+            try:
+                results = await components.retrieval_service.asearch_many([items[i].message for i in pending], k=plan.k, filters=request.filters)
+                for i, docs_for_query in zip(pending, results):
+                    retrieved[i] = docs_for_query
+                logger.info(f"Batch retrieval complete for {len(pending)} queries")
+            except CircuitOpenError:
+                logger.warning("Embeddings circuit open, batch will generate without retrieved context")
+            except Exception as e:
+                logger.error(f"Error during batch retrieval: {e}")
+
+        semaphore = asyncio.Semaphore(max(1, min(request.max_concurrency, self.settings.max_batch_concurrency)))
+
+        async def process(index: int) -> dict:
+            item = items[index]
+            record = {"index": index, "id": item.id, "response": None, "sources": [], "error": None}
+            start_time = time.time()
+            canned_response = self.fast_path_response(item.message)
+            if canned_response:
+                record["response"] = canned_response
+            else:
+                async with semaphore:
+                    # Each item is admitted like a /chat request, at the level current when it runs
+                    item_plan = self.brownout_plan()
+                    record["brownout"] = item_plan.name
+                    if item_plan.canned:
+                        record["response"] = BROWNOUT_RESPONSE
+                    else:
+                        record.update(await self.generate_batch_item(index, item.message, retrieved[index], item_plan))
+            record["latency_ms"] = round((time.time() - start_time) * 1000, 1)
+            return record
+
+        tasks = [asyncio.create_task(process(i)) for i in range(len(items))]
+        try:
+            # Results are streamed in completion order; clients match them up by index/id
+            for next_done in asyncio.as_completed(tasks):
+                record = await next_done
+                yield json.dumps(record) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
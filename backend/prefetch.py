@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    from .keywords import extract_keywords
+    from .retrieval import RetrievalService
+except ImportError:
+    from keywords import extract_keywords
+    from retrieval import RetrievalService
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_PATTERN = re.compile(r"[^.!?]+[.!?]*")
+
+
+class RetrievalPrefetcher:
+    # Speculative retrieval for a user's next turn. Once an answer is known (and
+    # while it is still being streamed out), the conversation's topics and the
+    # assistant's closing question are searched in the background. A follow-up
+    # that shares enough keywords with one of those searches -- or has no topical
+    # words of its own ("how do I do that?") -- reuses the cached results and
+    # skips embedding and search entirely.
+    def __init__(
+        self,
+        retrieval_service: RetrievalService,
+        ttl: float = 120.0,
+        max_users: int = 1000,
+        min_overlap: float = 0.5,
+        topic_keywords: int = 8,
+    ):
+        self.retrieval_service = retrieval_service
+        self.ttl = ttl
+        self.max_users = max_users
+        self.min_overlap = min_overlap
+        self.topic_keywords = topic_keywords
+
+        # user_id -> (expires_at, [(keywords, docs)]), least recently used first.
+        # The first entry is always the overall topic search.
+        self.entries: "OrderedDict[str, Tuple[float, List[Tuple[Set[str], list]]]]" = OrderedDict()
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.hits = 0
+        self.followup_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def candidate_queries(self, user_message: str, response: str) -> List[str]:
+        queries = []
+        topics = extract_keywords(f"{user_message} {response}", self.topic_keywords)
+        if topics:
+            queries.append(" ".join(topics))
+        # The therapist prompt ends on a follow-up question, which the next turn usually answers
+        questions = [s.strip() for s in SENTENCE_PATTERN.findall(response) if s.strip().endswith("?")]
+        if questions and extract_keywords(questions[-1]):
+            queries.append(questions[-1])
+        return queries
+
+    def schedule(self, user_id: str, user_message: str, response: str):
+        breaker = self.retrieval_service.breaker
+        if breaker and breaker.state != "closed":
+            # Never spend a half-open probe on speculative work
+            self.skipped += 1
+            return
+        queries = self.candidate_queries(user_message, response)
+        if not queries:
+            self.skipped += 1
+            return
+
+        previous = self.tasks.pop(user_id, None)
+        if previous:
+            previous.cancel()
+        self.scheduled += 1
+        task = asyncio.create_task(self._prefetch(user_id, queries))
+        self.tasks[user_id] = task
+        task.add_done_callback(lambda done: self._forget_task(user_id, done))
+
+    def _forget_task(self, user_id: str, task: asyncio.Task):
+        if self.tasks.get(user_id) is task:
+            del self.tasks[user_id]
+
+    async def _prefetch(self, user_id: str, queries: List[str]):
+        try:
+            results = await self.retrieval_service.asearch_many(queries)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Retrieval prefetch for {user_id} failed: {e}")
+            return
+
+        self.entries[user_id] = (
+            time.monotonic() + self.ttl,
+            [(set(extract_keywords(query, self.topic_keywords)), docs) for query, docs in zip(queries, results)]
+        )
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+        self.completed += 1
+
+    def lookup(self, user_id: str, message: str) -> Optional[list]:
+        cached = self.entries.get(user_id)
+        if cached is None:
+            self.misses += 1
+            return None
+        expires_at, entries = cached
+        if time.monotonic() > expires_at:
+            del self.entries[user_id]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        message_keywords = set(extract_keywords(message, self.topic_keywords))
+        if not message_keywords:
+            self.hits += 1
+            self.followup_hits += 1
+            return entries[0][1]
+
+        overlap, docs = max(
+            ((len(message_keywords & keywords) / len(message_keywords), docs) for keywords, docs in entries),
+            key=lambda item: item[0]
+        )
+        if overlap >= self.min_overlap:
+            self.hits += 1
+            self.entries.move_to_end(user_id)
+            return docs
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cached_users": len(self.entries),
+            "in_flight": len(self.tasks),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "followup_hits": self.followup_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+    def clear(self):
+        # Cached results are only valid for the retrieval service that produced them
+        self.close()
+        self.entries.clear()
+
+    def close(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
@@ -0,0 +1,243 @@
+import asyncio
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+STACK_LIMIT = 20
+
+
+class RequestProfiler:
+    # Sampled cProfile capture of whole requests, streaming bodies included. cProfile
+    # sees the event loop thread, so a capture also shows whatever else ran on the loop
+    # meanwhile; that is the point when hunting for blocking calls. Only one capture
+    # runs at a time (Python allows a single active profiler per thread).
+    def __init__(self, sample_rate: float = 0.0, max_results: int = 20):
+        self.sample_rate = sample_rate
+        self.results: Deque[dict] = deque(maxlen=max_results)
+        self.active = False
+        self.ids = itertools.count(1)
+        self.captured = 0
+        self.skipped_busy = 0
+
+    def should_profile(self) -> bool:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        if self.active:
+            self.skipped_busy += 1
+            return False
+        return True
+
+    def start(self) -> cProfile.Profile:
+        self.active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile: cProfile.Profile, label: str, started_at: float):
+        profile.disable()
+        self.active = False
+        profile.create_stats()
+        self.captured += 1
+        self.results.append({
+            "id": next(self.ids),
+            "label": label,
+            "timestamp": time.time(),
+            "duration_ms": round((time.monotonic() - started_at) * 1000, 1),
+            # Marshalled pstats data, the same bytes pstats.dump_stats writes
+            "data": marshal.dumps(profile.stats),
+        })
+
+    async def wrap_body(self, body: AsyncIterator, profile: cProfile.Profile, label: str, started_at: float) -> AsyncIterator:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.finish(profile, label, started_at)
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        return next((result for result in self.results if result["id"] == profile_id), None)
+
+    def report(self, profile_id: int, sort: str = "cumulative", limit: int = 40) -> Optional[str]:
+        result = self.get(profile_id)
+        if result is None:
+            return None
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        stats.stats = marshal.loads(result["data"])
+        stats.get_top_level_stats()
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "skipped_busy": self.skipped_busy,
+            "active": self.active,
+            "results": [{key: value for key, value in result.items() if key != "data"} for result in self.results],
+        }
+
+
+class LoopWatchdog:
+    # The loop bumps a heartbeat every interval; a watchdog thread that finds it stale
+    # for longer than threshold_ms snapshots the loop thread's stack, i.e. the code
+    # blocking the event loop right now.
+    def __init__(self, threshold_ms: float = 0.0, max_stalls: int = 20):
+        self.threshold_ms = threshold_ms
+        self.stalls: Deque[dict] = deque(maxlen=max_stalls)
+        self.heartbeat = time.monotonic()
+        self.max_lag_ms = 0.0
+        self.stall_count = 0
+        self.loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def interval(self) -> float:
+        return max(self.threshold_ms / 4000.0, 0.01)
+
+    def start(self, threshold_ms: Optional[float] = None):
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if self.threshold_ms <= 0 or (self._task and not self._task.done()):
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop watchdog started (threshold {self.threshold_ms:.0f}ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._thread = None
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.max_lag_ms = max(self.max_lag_ms, (now - expected) * 1000)
+            self.heartbeat = now
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self._stop.wait(self.interval):
+            stale_ms = (time.monotonic() - self.heartbeat) * 1000
+            # One report per stall, taken while the loop is still stuck
+            if stale_ms < self.threshold_ms or reported_heartbeat == self.heartbeat:
+                continue
+            reported_heartbeat = self.heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            self.stall_count += 1
+            self.stalls.append({
+                "timestamp": time.time(),
+                "blocked_ms_at_capture": round(stale_ms, 1),
+                "stack": traceback.format_stack(frame, limit=STACK_LIMIT) if frame else [],
+            })
+            logger.warning(f"Event loop blocked for {stale_ms:.0f}ms")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "threshold_ms": self.threshold_ms,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "stalls": self.stall_count,
+            "recent_stalls": list(self.stalls),
+        }
+
+
+def task_stacks(limit: int = STACK_LIMIT) -> List[dict]:
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        tasks.append({
+            "name": task.get_name(),
+            "coroutine": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "stack": [
+                f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+                for frame in task.get_stack(limit=limit)
+            ],
+        })
+    return sorted(tasks, key=lambda task: task["coroutine"])
+
+
+def start_tracemalloc(frames: int = 1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info("tracemalloc started")
+
+
+def stop_tracemalloc():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+
+
+def top_allocators(limit: int = 25, group_by: str = "lineno") -> Dict:
+    # Blocking (walks every traced block), callers run this on the maintenance pool
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_kib": round(current / 1024, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "top": [
+            {"location": str(stat.traceback[0]), "size_kib": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ],
+    }
+
+
+class ProfilingUpdate(BaseModel):
+    sample_rate: Optional[float] = None  # share of requests captured with cProfile, 0 disables
+    stall_threshold_ms: Optional[float] = None  # event loop watchdog, 0 disables
+    tracemalloc: Optional[bool] = None
+
+
+class Profiling:
+    # Everything the /admin/profiling endpoints toggle and report on
+    def __init__(self, sample_rate: float = 0.0, max_results: int = 20, stall_threshold_ms: float = 0.0):
+        self.requests = RequestProfiler(sample_rate, max_results)
+        self.watchdog = LoopWatchdog(stall_threshold_ms, max_results)
+
+    def update(self, update: ProfilingUpdate):
+        if update.sample_rate is not None:
+            self.requests.sample_rate = min(max(update.sample_rate, 0.0), 1.0)
+        if update.stall_threshold_ms is not None:
+            self.watchdog.stop()
+            self.watchdog.start(update.stall_threshold_ms)
+        if update.tracemalloc is True:
+            start_tracemalloc()
+        elif update.tracemalloc is False:
+            stop_tracemalloc()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests.stats(),
+            "loop_watchdog": self.watchdog.stats(),
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
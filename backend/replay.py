@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+try:
+    from . import components as component_factories
+    from .retrieval_client import UDS_PREFIX
+    from .topics import TOPIC_KEYWORDS
+    from .traffic import load_capture
+except ImportError:
+    import components as component_factories
+    from retrieval_client import UDS_PREFIX
+    from topics import TOPIC_KEYWORDS
+    from traffic import load_capture
+
+# Replays traffic captured with traffic_capture_path against a local instance with
+# fake LLM and embeddings providers, so cache and concurrency settings can be
+# compared on production-shaped load (no API keys needed).
+# Usage: python replay.py run /var/mindscribe/traffic --speed 10
+#        python replay.py run capture.jsonl --url http://127.0.0.1:8000  (an instance you started)
+# The local instance takes the usual MINDSCRIBE_* variables / MINDSCRIBE_CONFIG.
+
+FILLER_WORDS = (
+    "i", "feel", "really", "just", "so", "lately", "today", "work", "everything", "tired",
+    "keep", "thinking", "about", "my", "friends", "family", "again", "because", "night",
+    "week", "much", "know", "what", "to", "do", "it", "has", "been", "hard", "and",
+)
+FOLLOWUP_MESSAGES = ("how do I do that?", "can you explain more?", "what should I try first?", "why does that help?", "and then what?")
+DEFAULT_GENERATION = (1500.0, 600)  # ms, response chars when the capture has none
+READY_TIMEOUT = 120.0
+
+
+class ReplayEmbeddings(DeterministicFakeEmbedding):
+    delay_ms: float = 20.0
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.delay_ms / 1000)
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.delay_ms / 1000)
+        return self.embed_query(text)
+
+
+class ReplayLLM:
+    # Chat model stand-in: generation time and reply length are drawn together from
+    # the captured requests, and streamed in even chunks over that time
+    def __init__(self, samples: Sequence[Tuple[float, int]], latency_scale: float = 1.0, seed: int = 0):
+        self.samples = list(samples) or [DEFAULT_GENERATION]
+        self.latency_scale = latency_scale
+        self.random = random.Random(seed)
+
+    def _draw(self) -> Tuple[float, List[str]]:
+        generation_ms, chars = self.random.choice(self.samples)
+        words = ["word"] * max(1, chars // 5)
+        return generation_ms * self.latency_scale / 1000, [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+
+    async def ainvoke(self, prompt, **kwargs) -> str:
+        seconds, chunks = self._draw()
+        await asyncio.sleep(seconds)
+        return "".join(chunks)
+
+    async def astream(self, prompt, **kwargs):
+        seconds, chunks = self._draw()
+        for chunk in chunks:
+            await asyncio.sleep(seconds / len(chunks))
+            yield chunk
+
+    def bind(self, **kwargs) -> "ReplayLLM":
+        return self
+
+    def model_copy(self, update: Optional[dict] = None) -> "ReplayLLM":
+        return self
+
+
+class MessageSynthesizer:
+    # Stand-in text with a captured message's shape: its length and knowledge-base
+    # topics, the greeting or empty message it was, a keyword-free follow-up where it
+    # used a prefetch, and a repeat of an earlier message where it hit the query cache
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.sent: Dict[Tuple[str, ...], List[str]] = {}
+
+    def message(self, record: dict) -> str:
+        fast_path = record.get("fast_path")
+        if fast_path == "greeting":
+            return "hello"
+        if fast_path == "empty":
+            return ""
+        if record.get("prefetch_hit"):
+            return self.random.choice(FOLLOWUP_MESSAGES)
+        topics = tuple(topic for topic in record.get("topics") or () if topic in TOPIC_KEYWORDS)
+        previous = self.sent.get(topics)
+        if record.get("query_cache_hit") and previous:
+            return self.random.choice(previous)
+
+        words = [self.random.choice(TOPIC_KEYWORDS[topic]) for topic in topics]
+        while len(" ".join(words)) < record["chars"]:
+            words.insert(self.random.randrange(len(words) + 1), self.random.choice(FILLER_WORDS))
+        text = " ".join(words) or self.random.choice(FILLER_WORDS)
+        self.sent.setdefault(topics, []).append(text)
+        return text
+
+
+def request_class(record: dict) -> str:
+    if record.get("fast_path"):
+        return record["fast_path"]
+    return "prefetched" if record.get("prefetch_hit") else "full"
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1)}
+
+
+def http_client(url: str) -> httpx.AsyncClient:
+    if url.startswith(UDS_PREFIX):
+        return httpx.AsyncClient(base_url="http://replay-target", transport=httpx.AsyncHTTPTransport(uds=url[len(UDS_PREFIX):]), timeout=None)
+    return httpx.AsyncClient(base_url=url, timeout=None)
+
+
+async def send(client: httpx.AsyncClient, record: dict, message: str, due: float, previous: Optional[asyncio.Task]) -> dict:
+    # A user's next turn waits for the reply to the previous one, as it would live
+    if previous is not None:
+        await previous
+    started_at = time.monotonic()
+    result = {"class": request_class(record), "status": None, "lag_ms": round((started_at - due) * 1000, 1), "captured_ms": record.get("latency_ms")}
+    first_byte_at = None
+    try:
+        headers = {"accept": "text/event-stream"} if record.get("mode") == "events" else {}
+        payload = {"message": message, "user_id": f"replay-{record['user']}" if record.get("user") else None}
+        async with client.stream("POST", "/chat", json=payload, headers=headers) as response:
+            result["status"] = response.status_code
+            async for chunk in response.aiter_bytes():
+                if chunk and first_byte_at is None:
+                    first_byte_at = time.monotonic()
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    finished_at = time.monotonic()
+    result["latency_ms"] = round((finished_at - started_at) * 1000, 1)
+    result["ttfb_ms"] = round((first_byte_at - started_at) * 1000, 1) if first_byte_at else None
+    return result
+
+
+async def replay(records: List[dict], url: str, speed: float = 1.0, seed: int = 0) -> dict:
+    synthesizer = MessageSynthesizer(seed)
+    last_turn: Dict[str, asyncio.Task] = {}
+    tasks = []
+    async with http_client(url) as client:
+        start = time.monotonic()
+        for record in records:
+            due = start + record["at"] / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            user = record.get("user")
+            task = asyncio.create_task(send(client, record, synthesizer.message(record), due, last_turn.get(user) if user else None))
+            if user:
+                last_turn[user] = task
+            tasks.append(task)
+        results = await asyncio.gather(*tasks)
+        duration = time.monotonic() - start
+        health = (await client.get("/health")).json()
+    return summarize(records, results, duration, speed, health)
+
+
+def summarize(records: List[dict], results: List[dict], duration: float, speed: float, health: dict) -> dict:
+    classes = {}
+    for name in sorted({result["class"] for result in results}):
+        rows = [result for result in results if result["class"] == name]
+        classes[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if row["status"] != 200),
+            "latency": percentiles([row["latency_ms"] for row in rows]),
+            "ttfb": percentiles([row["ttfb_ms"] for row in rows if row["ttfb_ms"] is not None]),
+            "captured_latency": percentiles([row["captured_ms"] for row in rows if row["captured_ms"] is not None]),
+        }
+    captured_span = records[-1]["at"] if records else 0.0
+    retrieval = health.get("retrieval") or {}
+    return {
+        "requests": len(results),
+        "errors": sum(1 for result in results if result["status"] != 200),
+        "speed": speed,
+        "captured_seconds": round(captured_span, 1),
+        "replay_seconds": round(duration, 1),
+        "requests_per_second": round(len(results) / duration, 2) if duration else None,
+        # How far sends fell behind the captured schedule (client or per-user ordering)
+        "schedule_lag": percentiles([result["lag_ms"] for result in results]),
+        "latency": percentiles([result["latency_ms"] for result in results]),
+        "classes": classes,
+        "captured_hit_rates": {
+            "prefetch": round(sum(1 for record in records if record.get("prefetch_hit")) / len(records), 3) if records else None,
+            "query_cache": round(sum(1 for record in records if record.get("query_cache_hit")) / len(records), 3) if records else None,
+        },
+        "server": {
+            "status": health.get("status"),
+            "retrieval_prefetch": health.get("retrieval_prefetch"),
+            "query_cache": retrieval.get("query_cache"),
+            "query_embedding_batcher": health.get("query_embedding_batcher"),
+            "brownout": health.get("brownout"),
+            "executors": health.get("executors"),
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests ({report['errors']} errors) in {report['replay_seconds']}s "
+          f"at {report['speed']}x ({report['captured_seconds']}s captured), {report['requests_per_second']} req/s")
+    print(f"{'class':<14}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'captured p95':>14}")
+    for name, row in report["classes"].items():
+        latency = row["latency"] or {}
+        captured = row["captured_latency"] or {}
+        print(
+            f"{name:<14}{row['requests']:>10}{row['errors']:>8}{latency.get('p50_ms', 0):>10.1f}"
+            f"{latency.get('p95_ms', 0):>10.1f}{latency.get('p99_ms', 0):>10.1f}{captured.get('p95_ms', 0):>14.1f}"
+        )
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen):
+    deadline = time.monotonic() + READY_TIMEOUT
+    async with http_client(url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Replay server exited with code {process.returncode}")
+            try:
+                if (await client.get("/health")).json().get("components_ready"):
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Replay server not ready after {READY_TIMEOUT:.0f}s")
+
+
+def run(args):
+    records = load_capture(args.captures)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        sys.exit("No captured requests found")
+
+    process = None
+    url = args.url
+    tmp_dir = tempfile.TemporaryDirectory()
+    try:
+        if url is None:
+            socket_path = os.path.join(tmp_dir.name, "replay.sock")
+            command = [
+                sys.executable, os.path.abspath(__file__), "serve", *args.captures, "--uds", socket_path,
+                "--embed-ms", str(args.embed_ms), "--dim", str(args.dim), "--latency-scale", str(args.latency_scale),
+            ]
+            process = subprocess.Popen(command)
+            url = UDS_PREFIX + socket_path
+            asyncio.run(wait_until_ready(url, process))
+        print(f"Replaying {len(records)} requests against {url}")
+        report = asyncio.run(replay(records, url, args.speed, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        tmp_dir.cleanup()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+def serve(args):
+    import uvicorn
+
+    try:
+        from .app_factory import create_app
+        from .config import load_settings
+    except ImportError:
+        from app_factory import create_app
+        from config import load_settings
+
+    records = load_capture(args.captures)
+    samples = [(record["generation_ms"], record["response_chars"]) for record in records if record.get("generation_ms") and record.get("response_chars")]
+    component_factories.build_llm = lambda settings: ReplayLLM(samples, args.latency_scale)
+    component_factories.build_embeddings = lambda settings: ReplayEmbeddings(size=args.dim, delay_ms=args.embed_ms)
+    # Everything else (caches, history, brownout, executors...) is the configuration under test
+    settings = load_settings().model_copy(update={"traffic_capture_path": None, "retrieval_server_url": None})
+    uvicorn.run(create_app(settings), uds=args.uds, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured MindScribe /chat traffic")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay against a local fake-provider instance (or --url)")
+    run_parser.add_argument("captures", nargs="+", help="capture files or directories of traffic-*.jsonl")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="time compression, e.g. 10 replays an hour in 6 minutes")
+    run_parser.add_argument("--url", help="target an already running instance (http://host:port or unix:///path.sock)")
+    run_parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    run_parser.add_argument("--output", help="write the JSON report here")
+    run_parser.add_argument("--seed", type=int, default=0)
+
+    serve_parser = commands.add_parser("serve", help="run the fake-provider instance on a Unix socket")
+    serve_parser.add_argument("captures", nargs="+")
+    serve_parser.add_argument("--uds", required=True)
+    for sub in (run_parser, serve_parser):
+        sub.add_argument("--embed-ms", type=float, default=20.0, help="fake embeddings latency per call")
+        sub.add_argument("--dim", type=int, default=384, help="fake embeddings dimension")
+        sub.add_argument("--latency-scale", type=float, default=1.0, help="multiplies the captured generation times")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == "run":
+        run(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import logging
+import math
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+try:
+    from .keywords import extract_keywords, tokenize
+except ImportError:
+    from keywords import extract_keywords, tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Score above which a passage is worth sending to the LLM, per reranker
+DEFAULT_THRESHOLDS = {
+    "hybrid": 0.35,
+    "cross_encoder": 0.1,
+}
+
+
+def to_similarity(score: float, score_kind: str) -> float:
+    # FAISS flat indexes report squared L2 distance; for unit vectors that maps
+    # exactly onto cosine similarity. Components builds the FAISS store with
+    # normalize_L2, and the numpy engine normalizes its rows.
+    if score_kind == "l2":
+        return 1.0 - score / 2.0
+    return score
+
+
+def adaptive_cutoff(scored: List[Tuple[Document, float]], threshold: float, min_k: int, max_k: int) -> List[Tuple[Document, float]]:
+    ranked = sorted(scored, key=lambda item: item[1], reverse=True)[:max_k]
+    selected = [item for item in ranked if item[1] >= threshold]
+    return selected if len(selected) >= min_k else ranked[:min_k]
+
+
+class HybridReranker:
+    # Dependency-free: the shortlist's vector similarity blended with how many of
+    # the query's keywords each passage actually contains
+    name = "hybrid"
+
+    def __init__(self, lexical_weight: float = 0.3):
+        self.lexical_weight = lexical_weight
+
+    def load(self):
+        pass
+
+    def score(self, query: str, candidates: Sequence[Tuple[Document, float]]) -> List[float]:
+        query_keywords = set(extract_keywords(query, limit=16))
+        scores = []
+        for doc, similarity in candidates:
+            lexical = 0.0
+            if query_keywords:
+                lexical = len(query_keywords & set(tokenize(doc.page_content))) / len(query_keywords)
+            scores.append((1.0 - self.lexical_weight) * similarity + self.lexical_weight * lexical)
+        return scores
+
+
+class CrossEncoderReranker:
+    # Small local cross-encoder (sentence-transformers), scores in [0, 1]
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, max_length: int = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.model = None
+
+    def load(self):
+        # Blocking model load, callers run this on the maintenance pool
+        if self.model is None:
+            from sentence_transformers import CrossEncoder
+            self.model = CrossEncoder(self.model_name, max_length=self.max_length)
+            logger.info(f"Loaded cross-encoder reranker {self.model_name}")
+
+    def score(self, query: str, candidates: Sequence[Tuple[Document, float]]) -> List[float]:
+        self.load()
+        if not candidates:
+            return []
+        logits = self.model.predict([(query, doc.page_content) for doc, _ in candidates], show_progress_bar=False)
+        # Single-logit models already apply a sigmoid; clamp anything else into [0, 1]
+        return [float(score) if 0.0 <= score <= 1.0 else 1.0 / (1.0 + math.exp(-float(score))) for score in logits]
+
+
+def build_reranker(mode: str, model_name: Optional[str] = None):
+    if mode == "hybrid":
+        return HybridReranker()
+    if mode == "cross_encoder":
+        return CrossEncoderReranker(model_name or DEFAULT_CROSS_ENCODER)
+    raise ValueError(f"Unknown rerank mode '{mode}'")
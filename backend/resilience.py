@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # States: "closed" (normal), "open" (fail fast), "half_open" (one probe allowed)
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_time: float = 30.0,
+        min_timeout: float = 2.0,
+        max_timeout: float = 30.0,
+        timeout_multiplier: float = 3.0,
+        latency_window: int = 50,
+        min_samples: int = 5,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.latencies = deque(maxlen=latency_window)
+
+        self.total_calls = 0
+        self.total_failures = 0
+        self.total_timeouts = 0
+        self.total_rejected = 0
+        self.last_error: Optional[str] = None
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))
+        return ordered[index]
+
+    def current_timeout(self) -> float:
+        # Until we have enough samples, fall back to the generous upper bound
+        if len(self.latencies) < self.min_samples:
+            return self.max_timeout
+        p95 = self.latency_percentile(0.95)
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_multiplier))
+
+    def allow_request(self) -> bool:
+        if self.state == "closed":
+            return True
+
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.recovery_time:
+                return False
+            self.state = "half_open"
+            self.probe_in_flight = False
+            logger.info(f"Circuit '{self.name}' half-open, allowing a probe request")
+
+        # Half-open: only a single probe at a time
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            logger.info(f"Circuit '{self.name}' closed after successful probe")
+        self.state = "closed"
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self, error: BaseException):
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if isinstance(error, asyncio.TimeoutError):
+            self.total_timeouts += 1
+
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit '{self.name}' opened after {self.consecutive_failures} consecutive failures: {self.last_error}")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        if not self.allow_request():
+            self.total_rejected += 1
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        self.total_calls += 1
+        timeout = self.current_timeout()
+        start_time = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), timeout=timeout)
+        except asyncio.CancelledError:
+            # Client went away; don't count it against the dependency
+            self.probe_in_flight = False
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success(time.monotonic() - start_time)
+        return result
+
+    async def stream(self, func: Callable[..., AsyncIterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        # Streaming counterpart of call(): the whole stream shares one deadline, so
+        # recorded latencies stay comparable with non-streamed calls
+        if not self.allow_request():
+            self.total_rejected += 1
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        self.total_calls += 1
+        deadline = time.monotonic() + self.current_timeout()
+        start_time = time.monotonic()
+        iterator = func(*args, **kwargs).__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away mid-stream; don't count it against the dependency
+            self.probe_in_flight = False
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose:
+                await aclose()
+        self.record_success(time.monotonic() - start_time)
+
+    def snapshot(self) -> dict:
+        p50 = self.latency_percentile(0.5)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "current_timeout_s": round(self.current_timeout(), 3),
+            "latency_p50_s": round(p50, 3) if p50 is not None else None,
+            "latency_p95_s": round(p95, 3) if p95 is not None else None,
+            "total_calls": self.total_calls,
+            "total_failures": self.total_failures,
+            "total_timeouts": self.total_timeouts,
+            "total_rejected": self.total_rejected,
+            "last_error": self.last_error,
+            "retry_in_s": round(max(0.0, self.recovery_time - (time.monotonic() - self.opened_at)), 1) if self.state == "open" else None,
+        }
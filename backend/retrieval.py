@@ -0,0 +1,253 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    from .executors import run_in
+    from .reranking import adaptive_cutoff, to_similarity
+    from .vector_index import FILTER_OVERFETCH, Filters, filter_results
+except ImportError:
+    from executors import run_in
+    from reranking import adaptive_cutoff, to_similarity
+    from vector_index import FILTER_OVERFETCH, Filters, filter_results
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = 96  # Cohere embed API limit on texts per call
+
+
+class FaissStoreIndex:
+    # Adapter exposing a LangChain FAISS store through the same search_with_scores
+    # interface as EmbeddingMatrixIndex
+    score_kind = "l2"
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def __len__(self) -> int:
+        return self.vector_store.index.ntotal
+
+    def search_with_scores(self, query_matrix: np.ndarray, k: int, filters: Optional[Filters] = None) -> List[List[Tuple[Document, float]]]:
+        query_matrix = np.ascontiguousarray(np.atleast_2d(query_matrix), dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+            query_matrix = query_matrix / np.maximum(norms, 1e-12)
+
+        fetch_k = min(k * FILTER_OVERFETCH, len(self)) if filters else k
+        scores, indices = self.vector_store.index.search(query_matrix, fetch_k)
+
+        docstore = self.vector_store.docstore
+        index_to_docstore_id = self.vector_store.index_to_docstore_id
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            results.append([
+                (docstore.search(index_to_docstore_id[i]), float(score))
+                for score, i in zip(row_scores, row_indices) if i != -1
+            ])
+        return filter_results(results, filters, k) if filters else results
+
+
+class QueryVectorCache:
+    # LRU of query embeddings; repeated queries (greetings, prefetch topics, other
+    # workers asking the same thing through a retrieval server) skip the embeddings call
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        vector = self.vectors.get(query)
+        if vector is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.vectors.move_to_end(query)
+        return vector
+
+    def put(self, query: str, vector: np.ndarray):
+        self.vectors[query] = vector
+        self.vectors.move_to_end(query)
+        while len(self.vectors) > self.max_size:
+            self.vectors.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.vectors),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+class RetrievalService:
+    # Multi-query retrieval: one embeddings call per chunk of queries and one
+    # search over the stacked query matrix. `index` is a FaissStoreIndex or an
+    # EmbeddingMatrixIndex (anything with search_with_scores). An optional
+    # query_batcher coalesces single-query embeds from concurrent requests.
+    #
+    # With a reranker, retrieval is two-stage: a wide shortlist_k search, then the
+    # reranker scores the shortlist and only passages scoring at least
+    # rerank_threshold are kept (between min_k and k of them), so weak matches
+    # stop padding the prompt. An optional diversifier (dedup.NearDuplicateIndex)
+    # drops near-duplicate passages from the ranked candidates before the cut.
+    def __init__(
+        self,
+        index,
+        embeddings,
+        k: int = 5,
+        breaker=None,
+        query_batcher=None,
+        reranker=None,
+        shortlist_k: int = 20,
+        rerank_threshold: float = 0.35,
+        min_k: int = 1,
+        diversifier=None,
+        query_cache: Optional[QueryVectorCache] = None,
+        identity: Optional[str] = None,
+    ):
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+        self.breaker = breaker
+        self.query_batcher = query_batcher
+        self.reranker = reranker
+        self.shortlist_k = shortlist_k
+        self.rerank_threshold = rerank_threshold
+        self.min_k = min_k
+        self.diversifier = diversifier
+        self.query_cache = query_cache
+        self.identity = identity  # the embeddings model, e.g. "cohere:embed-english-v3.0"
+        self.dual_read = None  # index_versions.DualReadComparator while a re-index is compared
+        self.chosen_k_counts: Dict[int, int] = {}
+
+    async def _embed_chunk(self, texts: List[str]) -> List[List[float]]:
+        if hasattr(self.embeddings, "aembed"):
+            # Cohere distinguishes query and document embeddings
+            return await self.embeddings.aembed(texts, input_type="search_query")
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        queries = list(queries)
+        chunks = [queries[i:i + EMBED_BATCH_SIZE] for i in range(0, len(queries), EMBED_BATCH_SIZE)]
+        if self.breaker:
+            calls = [self.breaker.call(self._embed_chunk, chunk) for chunk in chunks]
+        else:
+            calls = [self._embed_chunk(chunk) for chunk in chunks]
+        chunk_vectors = await asyncio.gather(*calls)
+        return np.array([v for chunk in chunk_vectors for v in chunk], dtype=np.float32)
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        if self.query_cache is not None:
+            vector = self.query_cache.get(query)
+            if vector is not None:
+                return vector
+        if self.query_batcher:
+            vector = np.asarray(await self.query_batcher.embed(query), dtype=np.float32)
+        else:
+            vector = (await self.aembed_queries([query]))[0]
+        if self.query_cache is not None:
+            self.query_cache.put(query, vector)
+        return vector
+
+    def search_vectors(self, query_matrix: np.ndarray, k: Optional[int] = None, filters: Optional[Filters] = None) -> List[List[Tuple[Document, float]]]:
+        # Metadata filters, e.g. {"topic": ["sleep", "anxiety"]}; a PartitionedIndex
+        # prunes to the matching partitions before scanning
+        if filters:
+            return self.index.search_with_scores(query_matrix, k or self.k, filters=filters)
+        return self.index.search_with_scores(query_matrix, k or self.k)
+
+    async def asearch_many_with_scores(self, queries: Sequence[str], k: Optional[int] = None, filters: Optional[Filters] = None, vectors: Optional[np.ndarray] = None) -> List[List[Tuple[Document, float]]]:
+        # vectors: the queries' embeddings when the caller already has them
+        if not queries:
+            return []
+        if vectors is not None:
+            query_matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        elif len(queries) == 1:
+            query_matrix = (await self.aembed_query(queries[0]))[None, :]
+        else:
+            query_matrix = await self.aembed_queries(queries)
+        return await run_in("search", self.search_vectors, query_matrix, k, filters)
+
+    async def asearch_many(self, queries: Sequence[str], k: Optional[int] = None, filters: Optional[Filters] = None, vectors: Optional[np.ndarray] = None) -> List[List[Document]]:
+        requested_k = k
+        k = k or self.k
+        if self.reranker is None and self.diversifier is None:
+            results = await self.asearch_many_with_scores(queries, k, filters, vectors)
+            rows = [[doc for doc, _ in row] for row in results]
+        else:
+            fetch_k = k
+            if self.reranker is not None:
+                fetch_k = max(self.shortlist_k, k)
+            elif self.diversifier is not None:
+                fetch_k = k * self.diversifier.fetch_factor
+            results = await self.asearch_many_with_scores(queries, fetch_k, filters, vectors)
+            rows = await run_in("search", self.refine_rows, list(queries), results, k)
+        # Every served search path (chat, batch, retrieval server) feeds a running dual read
+        if self.dual_read is not None:
+            for query, docs in zip(queries, rows):
+                self.dual_read.observe(query, requested_k, filters, docs)
+        return rows
+
+    def refine_rows(self, queries: List[str], results: List[List[Tuple[Document, float]]], max_k: int) -> List[List[Document]]:
+        score_kind = getattr(self.index, "score_kind", "cosine")
+        selected_rows = []
+        for query, row in zip(queries, results):
+            scored = [(doc, to_similarity(score, score_kind)) for doc, score in row]
+            if self.reranker is not None:
+                scored = list(zip([doc for doc, _ in scored], self.reranker.score(query, scored)))
+                scored.sort(key=lambda item: item[1], reverse=True)
+            if self.diversifier is not None:
+                scored = self.diversifier.select(scored, max_k)
+            if self.reranker is None:
+                selected_rows.append([doc for doc, _ in scored[:max_k]])
+                continue
+
+            selected = adaptive_cutoff(scored, self.rerank_threshold, self.min_k, max_k)
+            chosen_k = len(selected)
+            self.chosen_k_counts[chosen_k] = self.chosen_k_counts.get(chosen_k, 0) + 1
+            top_score = selected[0][1] if selected else (scored[0][1] if scored else 0.0)
+            logger.info(f"Adaptive k={chosen_k} of {len(row)} shortlisted (top {self.reranker.name} score {top_score:.3f})")
+            selected_rows.append([doc for doc, _ in selected])
+        return selected_rows
+
+    def stats(self) -> dict:
+        total = sum(self.chosen_k_counts.values())
+        return {
+            "k": self.k,
+            "reranker": self.reranker.name if self.reranker else None,
+            "shortlist_k": self.shortlist_k if self.reranker else None,
+            "rerank_threshold": self.rerank_threshold if self.reranker else None,
+            "dedup": self.diversifier.stats() if self.diversifier else None,
+            "index": self.index.stats() if hasattr(self.index, "stats") else None,
+            "query_cache": self.query_cache.stats() if self.query_cache else None,
+            "chosen_k_histogram": dict(sorted(self.chosen_k_counts.items())),
+            "avg_chosen_k": round(sum(k * count for k, count in self.chosen_k_counts.items()) / total, 2) if total else None,
+        }
+
+    async def asearch(self, query: str, k: Optional[int] = None, filters: Optional[Filters] = None, vector: Optional[np.ndarray] = None) -> List[Document]:
+        return (await self.asearch_many([query], k, filters, None if vector is None else vector[None, :]))[0]
+
+    async def asearch_expanded(self, queries: Sequence[str], k: Optional[int] = None, filters: Optional[Filters] = None) -> List[Document]:
+        # For query-expansion strategies: search all variants at once, then fuse
+        results = await self.asearch_many_with_scores(queries, k, filters)
+        return fuse_results(results, k or self.k)
+
+
+def fuse_results(results: List[List[Tuple[Document, float]]], k: int, rrf_k: int = 60) -> List[Document]:
+    # Reciprocal rank fusion across the per-query result lists
+    scores: Dict[str, float] = {}
+    docs_by_key: Dict[str, Document] = {}
+    for row in results:
+        for rank, (doc, _) in enumerate(row):
+            key = doc.id or doc.page_content
+            docs_by_key[key] = doc
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs_by_key[key] for key in ranked[:k]]
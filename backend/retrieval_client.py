@@ -0,0 +1,118 @@
+import logging
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    from .retrieval import fuse_results
+    from .vector_index import Filters
+except ImportError:
+    from retrieval import fuse_results
+    from vector_index import Filters
+
+logger = logging.getLogger(__name__)
+
+UDS_PREFIX = "unix://"
+
+
+def to_document(item: dict) -> Document:
+    return Document(page_content=item["page_content"], metadata=item.get("metadata") or {})
+
+
+class RemoteRetrievalService:
+    # Thin client for retrieval_server.py with the RetrievalService interface the
+    # pipeline, prefetcher and user memory use. API workers built on it hold no
+    # embeddings model or index; one retrieval process serves many of them.
+    # url is "unix:///path/to/socket" or "http://host:port".
+    query_batcher = None  # the server coalesces embeds across all of its clients
+
+    def __init__(self, url: str, breaker=None, timeout: float = 10.0):
+        self.url = url
+        self.breaker = breaker
+        if url.startswith(UDS_PREFIX):
+            transport = httpx.AsyncHTTPTransport(uds=url[len(UDS_PREFIX):])
+            base_url = "http://retrieval-server"
+        else:
+            transport = None
+            base_url = url
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=timeout)
+        self.identity: Optional[str] = None  # the server's embeddings model, from its last /embed
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        start_time = time.monotonic()
+        self.requests += 1
+        try:
+            response = await self.client.post(path, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.total_time += time.monotonic() - start_time
+
+    async def _call(self, path: str, payload: dict) -> dict:
+        # Same breaker (and adaptive deadline) as local embedding calls
+        if self.breaker:
+            return await self.breaker.call(self._post, path, payload)
+        return await self._post(path, payload)
+
+    async def aembed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        data = await self._call("/embed", {"texts": list(queries)})
+        self.identity = data.get("embeddings", self.identity)
+        return np.array(data["vectors"], dtype=np.float32)
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        return (await self.aembed_queries([query]))[0]
+
+    async def asearch_many_with_scores(self, queries: Sequence[str], k: Optional[int] = None, filters: Optional[Filters] = None) -> List[List[Tuple[Document, float]]]:
+        if not queries:
+            return []
+        data = await self._call("/search", {"queries": list(queries), "k": k, "filters": filters, "with_scores": True})
+        return [[(to_document(item), item["score"]) for item in row] for row in data["results"]]
+
+    async def asearch_many(self, queries: Sequence[str], k: Optional[int] = None, filters: Optional[Filters] = None, vectors: Optional[np.ndarray] = None) -> List[List[Document]]:
+        if not queries:
+            return []
+        payload = {"queries": list(queries), "k": k, "filters": filters}
+        if vectors is not None:
+            # Embedded through /embed already; the server skips embedding them again
+            payload["vectors"] = np.asarray(vectors, dtype=np.float32).tolist()
+        data = await self._call("/search", payload)
+        return [[to_document(item) for item in row] for row in data["results"]]
+
+    async def asearch(self, query: str, k: Optional[int] = None, filters: Optional[Filters] = None, vector: Optional[np.ndarray] = None) -> List[Document]:
+        return (await self.asearch_many([query], k, filters, None if vector is None else vector[None, :]))[0]
+
+    async def asearch_expanded(self, queries: Sequence[str], k: Optional[int] = None, filters: Optional[Filters] = None) -> List[Document]:
+        results = await self.asearch_many_with_scores(queries, k, filters)
+        return fuse_results(results, k or max((len(row) for row in results), default=0))
+
+    async def server_status(self, timeout: float = 2.0) -> dict:
+        # For /health: the worker starts (and stays up) whether or not the server is
+        # reachable yet; searches fail over to no context until it answers
+        try:
+            response = await self.client.get("/health", timeout=timeout)
+            response.raise_for_status()
+            health = response.json()
+            return {"reachable": True, "status": health.get("status"), "error": health.get("error")}
+        except Exception as e:
+            return {"reachable": False, "status": None, "error": str(e) or type(e).__name__}
+
+    def stats(self) -> dict:
+        return {
+            "server": self.url,
+            "embeddings": self.identity,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_request_ms": round(1000 * self.total_time / self.requests, 2) if self.requests else None,
+        }
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import hmac
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import Depends, FastAPI, Header, HTTPException
+from pydantic import BaseModel
+
+try:
+    from .knowledge_base import documents as docs
+    from .config import Settings, load_settings
+    from .components import Components
+    from .executors import executor_stats
+    from .resilience import CircuitOpenError
+    from .lifecycle import Lifecycle
+    from .index_versions import ReindexRequest, Reindexer
+except ImportError:
+    from knowledge_base import documents as docs
+    from config import Settings, load_settings
+    from components import Components
+    from executors import executor_stats
+    from resilience import CircuitOpenError
+    from lifecycle import Lifecycle
+    from index_versions import ReindexRequest, Reindexer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_CACHE_SIZE = 10000
+
+
+class SearchRequest(BaseModel):
+    queries: List[str]
+    k: Optional[int] = None
+    filters: Optional[Dict[str, List[str]]] = None
+    with_scores: bool = False
+    vectors: Optional[List[List[float]]] = None  # the queries' embeddings, when the client has them
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+
+def serialize(doc, score: Optional[float] = None) -> dict:
+    item = {"page_content": doc.page_content, "metadata": doc.metadata}
+    if score is not None:
+        item["score"] = score
+    return item
+
+
+def create_retrieval_app(settings: Optional[Settings] = None) -> FastAPI:
+    # Owns the embeddings, index and query embedding cache for any number of API
+    # workers (retrieval_server_url). Same settings as the API, minus LLM and history.
+    settings = settings or load_settings()
+    settings = settings.model_copy(update={
+        "retrieval_server_url": None,
+        "history_provider": "none",
+        "query_cache_size": DEFAULT_QUERY_CACHE_SIZE if settings.query_cache_size is None else settings.query_cache_size,
+    })
+    components = Components(settings)
+
+    app = FastAPI()
+    app.state.components = components
+    # Requests are tracked so a re-index cut over retires the old index only once idle
+    lifecycle = Lifecycle(components, drain_timeout=settings.drain_timeout)
+    reindexer = Reindexer(components, lifecycle)
+    started = {"at": None}
+
+    def require_admin(x_admin_token: Optional[str] = Header(None)):
+        # Same admin secret as the API workers; unset means no admin surface
+        expected = os.getenv(settings.admin_token_env) if settings.admin_token_env else None
+        if not expected:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+            raise HTTPException(status_code=403, detail="Forbidden")
+
+    @app.middleware("http")
+    async def track_requests(request, call_next):
+        version = lifecycle.enter()
+        try:
+            return await call_next(request)
+        finally:
+            lifecycle.exit(version)
+
+    @app.on_event("startup")
+    async def startup_event():
+        start_time = time.monotonic()
+        if await components.initialize_retrieval(docs):
+            components.initialization_complete = True
+            started["at"] = time.time()
+            logger.info(f"Retrieval server ready in {time.monotonic() - start_time:.1f}s ({len(docs)} documents)")
+            if components.pending_reindex:
+                reindexer.start(ReindexRequest(settings=components.pending_reindex))
+        else:
+            logger.error(f"Retrieval server failed to start: {components.initialization_error}")
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await reindexer.close()
+        await lifecycle.close()
+        await components.close()
+
+    def service():
+        if components.retrieval_service is None:
+            raise HTTPException(status_code=503, detail=components.initialization_error or "Retrieval server is starting")
+        return components.retrieval_service
+
+    @app.post("/search")
+    async def search(request: SearchRequest):
+        retrieval_service = service()
+        try:
+            if request.with_scores:
+                rows = await retrieval_service.asearch_many_with_scores(request.queries, request.k, request.filters)
+                return {"results": [[serialize(doc, score) for doc, score in row] for row in rows]}
+            vectors = np.array(request.vectors, dtype=np.float32) if request.vectors else None
+            if vectors is not None and len(vectors) != len(request.queries):
+                raise HTTPException(status_code=400, detail="vectors must match queries one to one")
+            rows = await retrieval_service.asearch_many(request.queries, request.k, request.filters, vectors)
+            return {"results": [[serialize(doc) for doc in row] for row in rows]}
+        except CircuitOpenError:
+            raise HTTPException(status_code=503, detail="Embeddings circuit open")
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Embeddings timed out")
+
+    @app.post("/embed")
+    async def embed(request: EmbedRequest):
+        retrieval_service = service()
+        try:
+            # One at a time through the cache and cross-client batcher
+            vectors = await asyncio.gather(*[retrieval_service.aembed_query(text) for text in request.texts])
+        except CircuitOpenError:
+            raise HTTPException(status_code=503, detail="Embeddings circuit open")
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Embeddings timed out")
+        # Names the model behind these vectors, which changes when a re-index cuts over
+        return {"vectors": [vector.tolist() for vector in vectors], "embeddings": retrieval_service.identity}
+
+    @app.get("/health")
+    async def health_check():
+        retrieval_service = components.retrieval_service
+        settings = components.settings
+        return {
+            "status": "healthy" if retrieval_service else ("error" if components.initialization_error else "initializing"),
+            "error": components.initialization_error,
+            "started_at": started["at"],
+            "embeddings_provider": f"{settings.embeddings_provider} ({settings.embeddings_model})",
+            "embeddings": retrieval_service.identity if retrieval_service else None,
+            "documents_loaded": len(docs) if docs else 0,
+            "circuit_breaker": components.embeddings_breaker.snapshot(),
+            "retrieval": retrieval_service.stats() if retrieval_service else None,
+            "query_embedding_batcher": retrieval_service.query_batcher.stats() if retrieval_service and retrieval_service.query_batcher else None,
+            "index_versions": components.index_store.stats() if components.index_store else None,
+            "reindex": reindexer.stats(),
+            "executors": executor_stats(),
+        }
+
+    @app.get("/admin/reindex", dependencies=[Depends(require_admin)])
+    async def reindex_status():
+        return {
+            **reindexer.stats(),
+            "index_versions": components.index_store.stats() if components.index_store else None,
+        }
+
+    @app.post("/admin/reindex", dependencies=[Depends(require_admin)])
+    async def reindex_start(request: ReindexRequest):
+        service()
+        try:
+            return reindexer.start(request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.post("/admin/reindex/cutover", dependencies=[Depends(require_admin)])
+    async def reindex_cutover():
+        try:
+            return await reindexer.cut_over()
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @app.post("/admin/reindex/abort", dependencies=[Depends(require_admin)])
+    async def reindex_abort():
+        try:
+            return await reindexer.abort()
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="MindScribe shared retrieval server")
+    parser.add_argument("--uds", help="Unix socket path (workers use retrieval_server_url=unix://<path>)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_retrieval_app(load_settings())
+    if args.uds:
+        uvicorn.run(app, uds=args.uds)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
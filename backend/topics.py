@@ -0,0 +1,68 @@
+import re
+from typing import Dict, List
+
+DEFAULT_TOPIC = "general"
+
+# Phrases that mark a topic, matched on word boundaries in the source title and content
+TOPIC_KEYWORDS: Dict[str, List[str]] = {
+    "cbt": ["cbt", "cognitive behavioral", "cognitive behavioural", "thought record", "thought records", "cognitive distortion", "cognitive distortions", "cognitive restructuring"],
+    "dbt": ["dbt", "dialectical", "distress tolerance", "interpersonal effectiveness", "emotion regulation"],
+    "act": ["acceptance and commitment", "defusion", "observing self", "clarifying your values", "six core processes"],
+    "mindfulness": ["mindful", "mindfulness", "meditation", "breathing", "grounding", "5-4-3-2-1", "present moment", "body scan"],
+    "sleep": ["sleep", "insomnia", "bedtime", "sleep hygiene"],
+    "resilience": ["resilience", "resilient"],
+    "stress": ["stress", "stressful", "relaxation", "relax"],
+    "anxiety": ["anxiety", "anxious", "panic", "worry", "worries"],
+    "depression": ["depression", "depressed", "depressive", "low mood"],
+    "positive_psychology": ["positive psychology", "perma", "gratitude", "character strengths", "flourish", "flourishing", "well-being"],
+    "nutrition": ["diet", "food", "foods", "eating", "nutrition", "nutritious"],
+    "exercise": ["exercise", "exercises", "physical activity", "workout"],
+    "psychodynamic": ["psychodynamic", "unconscious"],
+    "therapy_types": ["types of therapy", "therapeutic modalities", "therapy approaches", "therapeutic approaches"],
+}
+
+TOPIC_PATTERNS = {
+    topic: re.compile(r"(?<![\w-])(" + "|".join(re.escape(phrase) for phrase in phrases) + r")(?![\w-])")
+    for topic, phrases in TOPIC_KEYWORDS.items()
+}
+SOURCE_WEIGHT = 3  # a source title names its topic more reliably than passing mentions
+
+
+def topic_scores(text: str) -> Dict[str, int]:
+    text = text.lower()
+    scores = {}
+    for topic, pattern in TOPIC_PATTERNS.items():
+        hits = len(pattern.findall(text))
+        if hits:
+            scores[topic] = hits
+    return scores
+
+
+def infer_topic(content: str, source: str = "") -> str:
+    # Single primary topic per document, used as its partition
+    scores = topic_scores(content)
+    for topic, hits in topic_scores(source).items():
+        scores[topic] = scores.get(topic, 0) + SOURCE_WEIGHT * hits
+    if not scores:
+        return DEFAULT_TOPIC
+    return max(scores, key=scores.get)
+
+
+def infer_query_topics(query: str) -> List[str]:
+    # Every topic a query mentions; empty when it names none (search everything)
+    return sorted(topic_scores(query))
+
+
+def source_site(source: str) -> str:
+    # "nhs.uk - Overview of CBT" -> "nhs.uk"
+    return source.split(" - ", 1)[0].strip().lower()
+
+
+def document_metadata(item: dict) -> dict:
+    # Ingest-time metadata; a knowledge entry may declare its "topic" explicitly
+    source = item.get("source", "")
+    return {
+        "source": source,
+        "source_site": source_site(source),
+        "topic": item.get("topic") or infer_topic(item["content"], source),
+    }
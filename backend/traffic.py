@@ -0,0 +1,151 @@
+import asyncio
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+try:
+    from .executors import run_in
+    from .topics import infer_query_topics
+except ImportError:
+    from executors import run_in
+    from topics import infer_query_topics
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FORMAT = 1
+MAX_TRACKED_USERS = 100000
+
+
+def note(shape: Optional[dict], **fields):
+    # Pipeline hook: a no-op unless this request is being captured
+    if shape is not None:
+        shape.update(fields)
+
+
+class TrafficCapture:
+    # Opt-in record of /chat request shapes for replay.py: timing, message length,
+    # knowledge-base topics, the user's turn index and which fast paths and caches
+    # hit. No message or response text is stored. User ids become pseudonyms keyed
+    # by a salt that is never written (random per process unless the workers share
+    # one), so a conversation's turns stay linked but cannot be traced back to the user.
+    #
+    # Users are sampled as a whole (by pseudonym) so captured conversations are
+    # complete. Each process appends to its own traffic-<start>-<pid>.jsonl, whose
+    # first line is a header; records carry t, seconds since that start.
+    def __init__(self, root: str, sample_rate: float = 1.0, salt: Optional[bytes] = None, batch_size: int = 100):
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"traffic-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.started_at = time.time()
+        self.started_monotonic = time.monotonic()
+        self._salt = salt or os.urandom(16)
+        self.turns: "OrderedDict[str, int]" = OrderedDict()
+        self.pending: List[str] = []
+        self.captured = 0
+        self.skipped = 0
+        self.written = 0
+        self._write_task: Optional[asyncio.Task] = None
+
+    def pseudonym(self, user_id: str) -> str:
+        return hmac.new(self._salt, user_id.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def begin(self, request, mode: str) -> Optional[dict]:
+        user = self.pseudonym(request.user_id) if request.user_id else None
+        sample = int(user[:8], 16) / 0xFFFFFFFF if user else random.random()
+        if sample >= self.sample_rate:
+            self.skipped += 1
+            return None
+        turn = None
+        if user:
+            turn = self.turns.pop(user, 0) + 1
+            self.turns[user] = turn
+            if len(self.turns) > MAX_TRACKED_USERS:
+                self.turns.popitem(last=False)
+        message = request.message or ""
+        return {
+            "t": round(time.monotonic() - self.started_monotonic, 3),
+            "user": user,
+            "turn": turn,
+            "mode": mode,
+            "chars": len(message),
+            "words": len(message.split()),
+            "topics": infer_query_topics(message),
+            "filters": bool(request.filters),
+            "fast_path": None,
+        }
+
+    def finish(self, shape: dict, started_at: float):
+        shape["latency_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+        self.pending.append(json.dumps(shape))
+        self.captured += 1
+        if len(self.pending) >= self.batch_size and (self._write_task is None or self._write_task.done()):
+            self._write_task = asyncio.create_task(self.flush())
+
+    def _write(self, lines: List[str]):
+        header = []
+        if not os.path.exists(self.path):
+            header = [json.dumps({"format": CAPTURE_FORMAT, "started_at": self.started_at, "sample_rate": self.sample_rate})]
+        with open(self.path, "a") as f:
+            f.write("\n".join(header + lines) + "\n")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        lines, self.pending = self.pending, []
+        try:
+            await run_in("storage", self._write, lines)
+            self.written += len(lines)
+        except Exception as e:
+            logger.error(f"Failed to write {len(lines)} traffic records to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "skipped": self.skipped,
+            "written": self.written,
+            "pending": len(self.pending),
+        }
+
+    async def close(self):
+        if self._write_task:
+            await self._write_task
+        await self.flush()
+
+
+def capture_files(paths: Iterable[str]) -> List[str]:
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "traffic-*.jsonl"))) if os.path.isdir(path) else [path])
+    return files
+
+
+def load_capture(paths: Iterable[str]) -> List[dict]:
+    # Records from any number of capture files (one per worker) on one timeline,
+    # each with "at": seconds since the earliest capture started
+    records = []
+    for path in capture_files(paths):
+        with open(path) as f:
+            header = json.loads(f.readline())
+            if header.get("format") != CAPTURE_FORMAT:
+                raise ValueError(f"Unsupported traffic capture format {header.get('format')} in {path}")
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    record["at"] = header["started_at"] + record["t"]
+                    records.append(record)
+    records.sort(key=lambda record: record["at"])
+    if records:
+        origin = records[0]["at"]
+        for record in records:
+            record["at"] -= origin
+    return records
@@ -0,0 +1,58 @@
+from typing import Optional
+
+
+def response_text(result) -> str:
+    # Chat models return messages, plain LLMs (Ollama) return strings
+    return getattr(result, "content", result)
+
+
+def response_usage(result) -> Optional[dict]:
+    # Token counts from an OpenAI-compatible chat response. Plain LLMs (Ollama) report none.
+    usage = getattr(result, "usage_metadata", None)
+    token_usage = (getattr(result, "response_metadata", None) or {}).get("token_usage") or {}
+    if not usage and not token_usage:
+        return None
+
+    usage = usage or {}
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached_tokens is None:
+        # Older langchain-openai only passes the raw provider payload through
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return {
+        "input_tokens": usage.get("input_tokens", token_usage.get("prompt_tokens", 0)) or 0,
+        "output_tokens": usage.get("output_tokens", token_usage.get("completion_tokens", 0)) or 0,
+        "cached_tokens": cached_tokens or 0,
+    }
+
+
+class TokenUsageTracker:
+    # Running totals of provider-reported usage, including prompt-prefix cache hits
+    def __init__(self):
+        self.calls = 0
+        self.calls_with_usage = 0
+        self.cache_hit_calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, usage: Optional[dict]):
+        self.calls += 1
+        if not usage:
+            return
+        self.calls_with_usage += 1
+        self.input_tokens += usage["input_tokens"]
+        self.cached_tokens += usage["cached_tokens"]
+        self.output_tokens += usage["output_tokens"]
+        if usage["cached_tokens"]:
+            self.cache_hit_calls += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "calls_with_usage": self.calls_with_usage,
+            "cache_hit_calls": self.cache_hit_calls,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_token_ratio": round(self.cached_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+        }
@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+try:
+    from .executors import run_in
+    from .vector_index import top_k
+except ImportError:
+    from executors import run_in
+    from vector_index import top_k
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+ENTRIES_FILE = "entries.jsonl"
+META_FILE = "meta.json"
+
+
+def format_memories(entries: Sequence[dict]) -> str:
+    if not entries:
+        return ""
+    lines = [f"- ({datetime.fromtimestamp(entry['timestamp']).strftime('%Y-%m-%d')}, {entry['kind']}) {entry['text']}" for entry in entries]
+    return "From earlier conversations with this user:\n" + "\n".join(lines) + "\n\n"
+
+
+class UserMemory:
+    # One user's long-term memory: a growable matrix of normalized float32 vectors
+    # plus the matching entries, mirrored by two append-only files on disk. identity
+    # names the embedding model the vectors came from.
+    def __init__(self, dimension: int, identity: str, vectors: Optional[np.ndarray] = None, entries: Optional[List[dict]] = None):
+        self.dimension = dimension
+        self.identity = identity
+        self.entries: List[dict] = entries or []
+        count = len(self.entries)
+        self.matrix = np.zeros((max(16, count * 2), dimension), dtype=np.float32)
+        if count:
+            self.matrix[:count] = vectors[:count]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def append(self, vector: np.ndarray, entry: dict):
+        count = len(self.entries)
+        if count == len(self.matrix):
+            # Amortized doubling instead of re-stacking on every message
+            grown = np.zeros((count * 2, self.dimension), dtype=np.float32)
+            grown[:count] = self.matrix
+            self.matrix = grown
+        self.matrix[count] = vector
+        self.entries.append(entry)
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[dict, float]]:
+        count = len(self.entries)
+        if not count:
+            return []
+        scores, rows = top_k((self.matrix[:count] @ query)[None, :], min(k, count))
+        return [(self.entries[row], float(score)) for score, row in zip(scores[0], rows[0])]
+
+
+class UserMemoryStore:
+    # Private, per-user vector memory over everything a user has said (and any journal
+    # entries), for recall beyond the prompt's short history window. Each user's
+    # memory is built incrementally as messages arrive, persisted under
+    # root/<hashed user id>/, loaded on the user's first request and kept in an LRU
+    # of at most max_users users. All disk I/O runs on the storage pool.
+    #
+    # embed_query is the retrieval service's query embedder, so the vector computed to
+    # recall against a message is the same one stored for it: no extra embedding call.
+    # identity names the model behind embed_query (the retrieval service's identity); memories
+    # stored under another model are set aside as .stale rather than searched.
+    def __init__(self, embed_query: Callable[[str], Awaitable[np.ndarray]], root: str, identity: Callable[[], str], max_users: int = 256, k: int = 3, min_score: float = 0.35):
+        self.embed_query = embed_query
+        self.identity = identity
+        self.root = root
+        self.max_users = max_users
+        self.k = k
+        self.min_score = min_score
+        self.loaded: "OrderedDict[str, UserMemory]" = OrderedDict()
+        self.loading: Dict[str, asyncio.Task] = {}
+        self.pending: Set[asyncio.Task] = set()
+
+        self.loads = 0
+        self.evictions = 0
+        self.remembered = 0
+        self.recalls = 0
+        self.recall_hits = 0
+        self.total_recall_time = 0.0
+
+    def user_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32])
+
+    def _read(self, user_id: str, dimension: int, identity: str) -> Optional[Tuple[np.ndarray, List[dict]]]:
+        directory = self.user_dir(user_id)
+        entries_path = os.path.join(directory, ENTRIES_FILE)
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(entries_path) or not os.path.exists(vectors_path):
+            return None
+        stored_identity = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored_identity = json.load(f).get("embeddings")
+        if stored_identity is not None and stored_identity != identity:
+            self._set_aside(user_id, f"stored vectors come from {stored_identity}, not {identity}")
+            return None
+        with open(entries_path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        vectors = np.fromfile(vectors_path, dtype=np.float32)
+        rows = len(vectors) // dimension
+        # At most one vector without its entry (crash between the two appends); anything
+        # else means the embedding model changed, so start over rather than mix spaces
+        if len(vectors) % dimension or rows not in (len(entries), len(entries) + 1):
+            self._set_aside(user_id, f"stored vectors do not match dimension {dimension}")
+            return None
+        count = len(entries)
+        return vectors[:count * dimension].reshape(count, dimension), entries
+
+    def _set_aside(self, user_id: str, reason: str):
+        logger.warning(f"Discarding memories for user {user_id}: {reason}")
+        directory = self.user_dir(user_id)
+        for name in (ENTRIES_FILE, VECTORS_FILE, META_FILE):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.replace(path, path + ".stale")
+
+    def _write(self, user_id: str, identity: str, vector: np.ndarray, entry: dict):
+        directory = self.user_dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w") as f:
+                json.dump({"embeddings": identity}, f)
+        # Vector first: on a crash between the two writes the extra vector is ignored
+        with open(os.path.join(directory, VECTORS_FILE), "ab") as f:
+            f.write(vector.astype(np.float32).tobytes())
+        with open(os.path.join(directory, ENTRIES_FILE), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    async def _load(self, user_id: str, dimension: int, identity: str) -> UserMemory:
+        persisted = await run_in("storage", self._read, user_id, dimension, identity)
+        self.loads += 1
+        if persisted is None:
+            return UserMemory(dimension, identity)
+        vectors, entries = persisted
+        logger.info(f"Loaded {len(entries)} memories for user {user_id}")
+        return UserMemory(dimension, identity, vectors, entries)
+
+    async def memory_for(self, user_id: str, dimension: int, identity: str) -> UserMemory:
+        memory = self.loaded.get(user_id)
+        if memory is not None and (memory.identity != identity or memory.dimension != dimension):
+            # Loaded before the embeddings were replaced; reloading discards the old vectors
+            del self.loaded[user_id]
+            memory = None
+        if memory is not None:
+            self.loaded.move_to_end(user_id)
+            return memory
+        # Concurrent first requests share one load
+        task = self.loading.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._load(user_id, dimension, identity))
+            self.loading[user_id] = task
+        try:
+            memory = await asyncio.shield(task)
+        finally:
+            if self.loading.get(user_id) is task and task.done():
+                del self.loading[user_id]
+        if user_id not in self.loaded:
+            self.loaded[user_id] = memory
+            while len(self.loaded) > self.max_users:
+                self.loaded.popitem(last=False)
+                self.evictions += 1
+        return self.loaded[user_id]
+
+    async def remember(self, user_id: str, text: str, kind: str = "message", vector: Optional[np.ndarray] = None):
+        if not user_id or not text.strip():
+            return
+        if vector is None:
+            vector = await self.embed_query(text)
+        # Read after embedding: with a retrieval server the identity comes with the vectors
+        identity = self.identity()
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        entry = {"text": text, "kind": kind, "timestamp": time.time()}
+        memory = await self.memory_for(user_id, len(vector), identity)
+        memory.append(vector, entry)
+        self.remembered += 1
+        await run_in("storage", self._write, user_id, identity, vector, entry)
+
+    def remember_later(self, user_id: str, text: str, kind: str = "message", vector: Optional[np.ndarray] = None):
+        # Off the request path; failures only cost recall
+        task = asyncio.create_task(self.remember(user_id, text, kind, vector))
+        self.pending.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self.pending.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Failed to store user memory: {task.exception()}")
+
+    async def recall(self, user_id: str, query_vector: np.ndarray, exclude: Set[str] = frozenset()) -> List[dict]:
+        start_time = time.monotonic()
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        memory = await self.memory_for(user_id, len(query), self.identity())
+        # Over-fetch so memories already in the prompt window (or repeated) can be skipped
+        found = memory.search(query, 2 * self.k + len(exclude))
+        recalled = []
+        seen = set(exclude)
+        for entry, score in found:
+            if score < self.min_score or len(recalled) == self.k:
+                break
+            if entry["text"] not in seen:
+                seen.add(entry["text"])
+                recalled.append(entry)
+        self.recalls += 1
+        if recalled:
+            self.recall_hits += 1
+        self.total_recall_time += time.monotonic() - start_time
+        return recalled
+
+    def stats(self) -> dict:
+        return {
+            "loaded_users": len(self.loaded),
+            "max_users": self.max_users,
+            "loaded_memories": sum(len(memory) for memory in self.loaded.values()),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "remembered": self.remembered,
+            "pending_writes": len(self.pending),
+            "recalls": self.recalls,
+            "recall_hits": self.recall_hits,
+            "avg_recall_ms": round(1000 * self.total_recall_time / self.recalls, 2) if self.recalls else None,
+        }
+
+    async def flush(self):
+        if self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_DTYPES = ("float32", "float16")
+QUANTIZATIONS = ("none", "int8", "binary")
+INDEX_FORMAT_VERSION = 1
+SCORE_BLOCK_ROWS = 8192  # rows upcast at a time when scoring float16/int8 storage
+HAMMING_BLOCK_BYTES = 1 << 24  # cap on the XOR temporary when scoring binary codes
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[values]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.ascontiguousarray(np.atleast_2d(matrix), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Symmetric per-row scaling: vector ~= codes * scale
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return np.ascontiguousarray(codes), scales
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(np.packbits(vectors > 0, axis=1))
+
+
+Filters = Dict[str, Union[str, Sequence[str]]]
+FILTER_OVERFETCH = 4  # candidates scanned per result when filtering after the vector scan
+
+
+def allowed_values(value: Union[str, Sequence[str]]) -> set:
+    return {value} if isinstance(value, str) else set(value)
+
+
+def matches_filters(metadata: dict, filters: Optional[Filters]) -> bool:
+    if not filters:
+        return True
+    return all(metadata.get(field) in allowed_values(value) for field, value in filters.items())
+
+
+def filter_results(results: List[List[Tuple[Document, float]]], filters: Optional[Filters], k: int) -> List[List[Tuple[Document, float]]]:
+    return [[(doc, score) for doc, score in row if matches_filters(doc.metadata, filters)][:k] for row in results]
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Row-wise top-k by descending score: argpartition, then sort only the k winners
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.float32), empty.astype(np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidate_scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def store_fingerprint(vector_store, **params) -> str:
+    # What an index built from this FAISS store with these parameters would contain:
+    # the vectors, documents (including cluster ids) and index settings
+    count = vector_store.index.ntotal
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(np.ascontiguousarray(vector_store.index.reconstruct_n(0, count), dtype=np.float32).tobytes())
+    for i in range(count):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+        digest.update(json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def publish_index(index, path: str) -> bool:
+    # Saves into a fresh sibling directory and renames it into place, so a directory
+    # that is being served (rerank vectors memory-mapped) is never rewritten or
+    # truncated. Returns False when another process published path first.
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(path) + ".tmp-")
+    try:
+        index.save(staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    try:
+        os.replace(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+        return False
+    return True
+
+
+class EmbeddingMatrixIndex:
+    # Exact (or quantized + re-ranked) cosine search over one contiguous matrix of
+    # normalized embeddings. Row i belongs to ids[i] / texts[i] / metadatas[i].
+    #
+    # quantization="int8" keeps int8 codes plus a per-row scale, "binary" keeps one
+    # sign bit per dimension. When full-precision rerank_vectors are available
+    # (typically memory-mapped from a persisted index) the quantized scores only pick
+    # a shortlist of k * rerank_factor rows, which is then re-scored exactly.
+    score_kind = "cosine"
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[dict]] = None,
+        ids: Optional[Sequence[int]] = None,
+        dtype: str = "float32",
+        quantization: str = "none",
+        keep_rerank_vectors: bool = False,
+        rerank_factor: int = 4,
+    ):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(texts)} texts")
+
+        self.dtype = dtype
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.ids = np.asarray(ids if ids is not None else np.arange(len(texts)), dtype=np.int64)
+        self.texts = list(texts)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+
+        normalized = normalize_rows(vectors)
+        self.dimension = normalized.shape[1]
+        self.vectors = None
+        self.codes = None
+        self.scales = None
+        self.rerank_vectors = None
+        if quantization == "none":
+            self.vectors = np.ascontiguousarray(normalized, dtype=dtype)
+        else:
+            if quantization == "int8":
+                self.codes, self.scales = quantize_int8(normalized)
+            else:
+                self.codes = quantize_binary(normalized)
+            if keep_rerank_vectors:
+                self.rerank_vectors = np.ascontiguousarray(normalized, dtype=dtype)
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], embeddings, **kwargs) -> "EmbeddingMatrixIndex":
+        texts = [doc.page_content for doc in documents]
+        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        return cls(vectors, texts, [doc.metadata for doc in documents], **kwargs)
+
+    @classmethod
+    def from_faiss(cls, vector_store, **kwargs) -> "EmbeddingMatrixIndex":
+        # Reuse the vectors already held by a LangChain FAISS store instead of re-embedding
+        count = vector_store.index.ntotal
+        vectors = vector_store.index.reconstruct_n(0, count)
+        documents = [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(count)]
+        return cls(vectors, [doc.page_content for doc in documents], [doc.metadata for doc in documents], **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def nbytes(self) -> int:
+        # Resident search structures only; memory-mapped rerank vectors live in the page cache
+        total = self.ids.nbytes
+        for array in (self.vectors, self.codes, self.scales):
+            if array is not None:
+                total += array.nbytes
+        if self.rerank_vectors is not None and not isinstance(self.rerank_vectors, np.memmap):
+            total += self.rerank_vectors.nbytes
+        return total
+
+    def _float_scores(self, queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        # float16 has no BLAS path; upcast in bounded blocks instead of copying the whole matrix
+        result = np.empty((queries.shape[0], len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            result[:, start:start + len(block)] = queries @ block.T
+        return result
+
+    def _int8_scores(self, queries: np.ndarray) -> np.ndarray:
+        result = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            result[:, start:start + len(block)] = (queries @ block.T) * self.scales[start:start + len(block)]
+        return result
+
+    def _binary_scores(self, queries: np.ndarray) -> np.ndarray:
+        # 1 - 2 * hamming / dim approximates cosine similarity for sign codes
+        query_codes = quantize_binary(queries)
+        result = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        block_rows = max(1, HAMMING_BLOCK_BYTES // max(1, queries.shape[0] * self.codes.shape[1]))
+        for start in range(0, len(self), block_rows):
+            block = self.codes[start:start + block_rows]
+            distances = popcount(query_codes[:, None, :] ^ block[None, :, :]).sum(axis=2, dtype=np.int32)
+            result[:, start:start + len(block)] = 1.0 - 2.0 * distances / self.dimension
+        return result
+
+    def scores(self, query_matrix: np.ndarray) -> np.ndarray:
+        queries = normalize_rows(query_matrix)
+        if self.quantization == "int8":
+            return self._int8_scores(queries)
+        if self.quantization == "binary":
+            return self._binary_scores(queries)
+        return self._float_scores(queries, self.vectors)
+
+    def search(self, query_matrix: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.quantization == "none" or self.rerank_vectors is None:
+            return top_k(self.scores(query_matrix), k)
+
+        queries = normalize_rows(query_matrix)
+        _, shortlist = top_k(self.scores(queries), k * self.rerank_factor)
+        k = min(k, shortlist.shape[1])
+        result_scores = np.empty((len(queries), k), dtype=np.float32)
+        result_rows = np.empty((len(queries), k), dtype=np.int64)
+        for i, rows in enumerate(shortlist):
+            # Sorted fancy indexing into a memmap only touches the shortlisted rows
+            rows = np.sort(rows)
+            exact = np.asarray(self.rerank_vectors[rows], dtype=np.float32) @ queries[i]
+            best_scores, best = top_k(exact[None, :], k)
+            result_scores[i] = best_scores[0]
+            result_rows[i] = rows[best[0]]
+        return result_scores, result_rows
+
+    def document(self, row: int) -> Document:
+        return Document(page_content=self.texts[row], metadata=self.metadatas[row], id=str(self.ids[row]))
+
+    def search_with_scores(self, query_matrix: np.ndarray, k: int, filters: Optional[Filters] = None) -> List[List[Tuple[Document, float]]]:
+        scores, rows = self.search(query_matrix, k * FILTER_OVERFETCH if filters else k)
+        results = [
+            [(self.document(row), float(score)) for score, row in zip(row_scores, row_indices)]
+            for row_scores, row_indices in zip(scores, rows)
+        ]
+        return filter_results(results, filters, k) if filters else results
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        if self.quantization == "none":
+            np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        else:
+            np.save(os.path.join(path, "codes.npy"), self.codes)
+            if self.scales is not None:
+                np.save(os.path.join(path, "scales.npy"), self.scales)
+            if self.rerank_vectors is not None:
+                np.save(os.path.join(path, "rerank_vectors.npy"), np.asarray(self.rerank_vectors))
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        with open(os.path.join(path, "documents.json"), "w") as f:
+            json.dump({"texts": self.texts, "metadatas": self.metadatas}, f)
+
+        meta = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "quantization": self.quantization,
+            "dtype": self.dtype,
+            "dimension": self.dimension,
+            "count": len(self),
+            "rerank_factor": self.rerank_factor,
+            "has_rerank_vectors": self.rerank_vectors is not None,
+        }
+        # meta.json is written last; with publish_index the directory is fresh, so a
+        # half-written index is never loaded
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        logger.info(f"Saved {self.quantization} index with {len(self)} vectors to {path}")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "EmbeddingMatrixIndex":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version {meta.get('format_version')} in {path}")
+        with open(os.path.join(path, "documents.json")) as f:
+            documents = json.load(f)
+
+        index = cls.__new__(cls)
+        index.dtype = meta["dtype"]
+        index.quantization = meta["quantization"]
+        index.rerank_factor = meta["rerank_factor"]
+        index.dimension = meta["dimension"]
+        index.texts = documents["texts"]
+        index.metadatas = documents["metadatas"]
+        index.ids = np.load(os.path.join(path, "ids.npy"))
+        index.vectors = None
+        index.codes = None
+        index.scales = None
+        index.rerank_vectors = None
+        if index.quantization == "none":
+            index.vectors = np.load(os.path.join(path, "vectors.npy"))
+        else:
+            index.codes = np.load(os.path.join(path, "codes.npy"))
+            if index.quantization == "int8":
+                index.scales = np.load(os.path.join(path, "scales.npy"))
+            if meta["has_rerank_vectors"]:
+                index.rerank_vectors = np.load(os.path.join(path, "rerank_vectors.npy"), mmap_mode="r" if mmap else None)
+        return index
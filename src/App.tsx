@@ -113,7 +113,7 @@ export default function App() {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Accept': 'text/plain'
+          'Accept': 'text/event-stream, text/plain'
         },
         body: JSON.stringify({
           message: text,
@@ -150,6 +150,45 @@ export default function App() {
       let done = false;
       let fullResponse = "";
 
+      // Structured SSE stream: sources arrive before the first token
+      if (response.headers.get('content-type')?.includes('text/event-stream')) {
+        let buffer = "";
+        let content = "";
+        let sources: Array<{ source: string }> = [];
+
+        while (!done) {
+          const { value, done: readerDone } = await reader.read();
+          done = readerDone;
+          buffer += decoder.decode(value, { stream: !readerDone });
+
+          const events = buffer.split("\n\n");
+          buffer = events.pop() || "";
+          for (const rawEvent of events) {
+            let eventName = "message";
+            let data = "";
+            for (const line of rawEvent.split("\n")) {
+              if (line.startsWith("event: ")) eventName = line.slice(7);
+              else if (line.startsWith("data: ")) data += line.slice(6);
+            }
+            try {
+              const payload = JSON.parse(data || "{}");
+              if (eventName === "retrieval") sources = payload.sources || [];
+              else if (eventName === "delta") content += payload.text || "";
+              else if (eventName === "timing") console.debug('Chat timing:', payload);
+            } catch (e) {
+              console.warn('Error parsing event:', e);
+            }
+          }
+
+          setMessages(prev =>
+            prev.map(msg =>
+              msg.id === aiMessageId ? { ...msg, text: content, sources: sources } : msg
+            )
+          );
+        }
+        return;
+      }
+
       while (!done) {
         const { value, done: readerDone } = await reader.read();
         done = readerDone;